@@ -4,7 +4,8 @@ from src import VIEW
 
 if __name__ == "__main__":
 
-    Processor = MODEL.TableProcessor()
+    Processor = MODEL.TableProcessor(index_spec=CONTROLLER.INDICES, snapshots=CONTROLLER.SNAPSHOTS,
+                                     compact_dtypes=True, schemas=CONTROLLER.ESQUEMAS, concurrent=True)
 
     if input("CARGAR DATOS NUEVOS [Y/N]: ").capitalize() == "Y":
         CONTROLLER._setUpDataBase(Processor, "Background.xlsx")
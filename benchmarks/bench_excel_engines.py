@@ -0,0 +1,111 @@
+"""Compare the Excel reader engines of TableProcessor.ImportFromExcel.
+
+Each engine imports the same sheet into a scratch SQLite database in its own
+process, so the reported peak memory belongs to that engine alone.
+
+    python benchmarks/bench_excel_engines.py                      # synthetic 200k-row sheet
+    python benchmarks/bench_excel_engines.py --file VENTA.XLSX --sheet Sheet1
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import MODEL
+
+
+def peak_memory_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 1024 / 1024
+        except (ImportError, AttributeError):
+            return None
+
+
+def write_synthetic_sheet(path, rows):
+    """Sales-like sheet written with openpyxl in write-only mode."""
+    import openpyxl
+
+    rng = random.Random(0)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append(["Centro", "Canal distribución", "Cliente", "Artículo", "Clase de factura",
+                  "Período/Año", "Volumen de ventas", "Valor Neto"])
+    for _ in range(rows):
+        sheet.append([
+            rng.choice(["G601", "P100", "H200"]), rng.choice(["10", "20", "30"]),
+            str(rng.randint(100000, 999999)), f"{rng.randint(1000, 9999)}-0{rng.randint(1, 9)}",
+            rng.choice(["ZFAC", "ZSER"]), "001.2024", rng.randint(1, 500), round(rng.uniform(1, 5000), 2),
+        ])
+    workbook.save(path)
+
+
+def run_worker(args):
+    db_path = os.path.join(args.workdir, f"bench_{args.engine}.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    start = time.perf_counter()
+    with MODEL.TableProcessor(db_path) as processor:
+        rows = processor.ImportFromExcel(args.file, args.sheet, "BENCH", engine=args.engine,
+                                         batch_size=args.batch_size)
+    seconds = time.perf_counter() - start
+
+    print(json.dumps({"engine": args.engine, "rows": rows, "seconds": seconds, "peak_mb": peak_memory_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", help="Workbook to import (a synthetic one is generated when omitted)")
+    parser.add_argument("--sheet", default="Sheet1")
+    parser.add_argument("--rows", type=int, default=200000, help="Rows of the synthetic sheet")
+    parser.add_argument("--engines", nargs="+", default=["pandas", "openpyxl", "calamine"])
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--engine", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.file is None:
+            args.file = os.path.join(workdir, "synthetic.xlsx")
+            print(f"Generating synthetic sheet with {args.rows:,} rows...")
+            write_synthetic_sheet(args.file, args.rows)
+
+        size_mb = os.path.getsize(args.file) / 1024 / 1024
+        print(f"\n{os.path.basename(args.file)} ({size_mb:.1f} MB), sheet '{args.sheet}'\n")
+        print(f"{'engine':<10} {'rows':>10} {'seconds':>9} {'rows/s':>10} {'peak MB':>9}")
+
+        for engine in args.engines:
+            command = [sys.executable, os.path.abspath(__file__), "--worker", "--engine", engine,
+                       "--file", args.file, "--sheet", args.sheet, "--workdir", workdir,
+                       "--batch-size", str(args.batch_size)]
+            result = subprocess.run(command, capture_output=True, text=True)
+            if result.returncode != 0:
+                error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"
+                print(f"{engine:<10} {error}")
+                continue
+
+            stats = json.loads(result.stdout.strip().splitlines()[-1])
+            peak = f"{stats['peak_mb']:.0f}" if stats["peak_mb"] is not None else "n/a"
+            print(f"{engine:<10} {stats['rows']:>10,} {stats['seconds']:>9.2f} "
+                  f"{stats['rows'] / stats['seconds']:>10,.0f} {peak:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""End-to-end benchmark of the sales pipeline on synthetic data, with regression checks.
+
+Runs every stage the menu runs, in order, on a scratch database: loading Background.xlsx,
+ingesting Historial_de_Venta, concatenating, completing the columns, the three pivot
+reports (each with its Excel export) and the export of the completed table. The data
+is generated once per scale with synthetic_data.py and reused by later runs.
+
+Stage times are compared with benchmarks/baselines.json and the exit code is 1 when a
+stage is slower than its baseline by more than --threshold. Baselines depend on the
+machine, record them with --save-baseline on the machine that runs the comparison.
+
+    python benchmarks/bench_pipeline.py --scale 100k --save-baseline
+    python benchmarks/bench_pipeline.py --scale 100k              # compare with the baseline
+    python benchmarks/bench_pipeline.py --scale 1M --threshold 0.15
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from src import MODEL
+from src import CONTROLLER
+import synthetic_data
+
+SCALES = {"100k": 100000, "1M": 1000000, "10M": 10000000}
+BASELINES_PATH = os.path.join(BENCH_DIR, "baselines.json")
+
+
+def stages(processor):
+    """(name, function) of every stage, in the order they run."""
+    return [
+        ("setup", lambda: CONTROLLER._setUpDataBase(processor, "Background.xlsx")),
+        ("ingest", lambda: CONTROLLER._cargarVentaHistorica(processor)),
+        ("concat", lambda: CONTROLLER._concatenateTabels(processor)),
+        ("complete", lambda: CONTROLLER._completarVentaHistorica(processor)),
+        ("pivot_bruta", lambda: CONTROLLER._pivotearDescargar_VENTA_BRUTA(processor)),
+        ("pivot_neta", lambda: CONTROLLER._pivotearDescargar_VENTA_NETA(processor)),
+        ("pivot_canal", lambda: CONTROLLER._pivotearDescargar_VENTA_POR_CANAL(processor)),
+        ("export", lambda: processor.ExportToExcel("VentaHistoricaTOTAL", "VentaHistoricaTOTAL.xlsx")),
+    ]
+
+
+def run(data_dir, verbose):
+    """Run the stages inside `data_dir` and return {stage: seconds}."""
+    db_path = os.path.join(data_dir, "bench.db")
+    for path in (db_path, f"{db_path}-wal", f"{db_path}-shm", os.path.join(data_dir, "merge_warnings.txt")):
+        if os.path.exists(path):
+            os.remove(path)
+
+    # The controller reads Background.xlsx and Historial_de_Venta from the working directory
+    previous = os.getcwd()
+    os.chdir(data_dir)
+    try:
+        processor = MODEL.TableProcessor(db_path, index_spec=CONTROLLER.INDICES, snapshots=CONTROLLER.SNAPSHOTS,
+                                         compact_dtypes=True, schemas=CONTROLLER.ESQUEMAS, concurrent=True)
+        times = {}
+        for name, stage in stages(processor):
+            output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+            errors = contextlib.nullcontext() if verbose else contextlib.redirect_stderr(io.StringIO())
+            start = time.perf_counter()
+            with output, errors:
+                stage()
+            times[name] = time.perf_counter() - start
+            print(f"  {name:<12} {times[name]:>9.2f} s")
+        processor.close()
+    finally:
+        os.chdir(previous)
+    return times
+
+
+def compare(times, baseline, threshold, min_seconds):
+    """Stages slower than their baseline by more than `threshold`, ignoring differences under `min_seconds`."""
+    regressions = []
+    for name, seconds in times.items():
+        if name in baseline and seconds > baseline[name] * (1 + threshold) and seconds - baseline[name] > min_seconds:
+            regressions.append((name, baseline[name], seconds))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="100k")
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--match-rate", type=float, default=0.97)
+    parser.add_argument("--data-dir", help="Where the synthetic data lives (defaults to benchmarks/data/<scale>)")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed slowdown over the baseline, as a fraction (0.25 = 25%%)")
+    parser.add_argument("--min-seconds", type=float, default=0.5,
+                        help="Slowdowns smaller than this many seconds are never regressions")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline of the scale")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the stages")
+    args = parser.parse_args()
+
+    data_dir = os.path.abspath(args.data_dir or os.path.join(BENCH_DIR, "data", args.scale))
+    if not os.path.exists(os.path.join(data_dir, "Background.xlsx")):
+        print(f"Generating {SCALES[args.scale]:,} rows of synthetic data in {data_dir}...")
+        start = time.perf_counter()
+        synthetic_data.generate(data_dir, SCALES[args.scale], args.months, args.match_rate)
+        print(f"Generated in {time.perf_counter() - start:.1f} s")
+
+    print(f"\nPipeline on {data_dir}\n")
+    times = run(data_dir, args.verbose)
+    print(f"  {'total':<12} {sum(times.values()):>9.2f} s")
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH, encoding="utf-8") as file:
+            baselines = json.load(file)
+
+    if args.save_baseline:
+        baselines[args.scale] = {name: round(seconds, 3) for name, seconds in times.items()}
+        with open(BASELINES_PATH, "w", encoding="utf-8") as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+        print(f"\nBaseline for {args.scale} saved to {BASELINES_PATH}")
+        return
+
+    if args.scale not in baselines:
+        print(f"\nNo baseline for {args.scale}, run with --save-baseline to record one")
+        return
+
+    regressions = compare(times, baselines[args.scale], args.threshold, args.min_seconds)
+    for name, before, after in regressions:
+        print(f"REGRESSION {name}: {before:.2f} s -> {after:.2f} s (+{(after / before - 1) * 100:.0f}%)")
+    if regressions:
+        sys.exit(1)
+    print(f"\nNo stage slower than its baseline by more than {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Generate a synthetic Background.xlsx and Historial_de_Venta folder to test at scale.
+
+The sheets use the real table and column names, and the sales keys (Cliente,
+Artículo, Centro) exist in the dimension sheets with a controlled probability, so
+lookups miss at a known rate. Codes are written the way the company workbooks
+have them: client and channel codes as numbers, some service codes with blanks.
+
+    python benchmarks/synthetic_data.py --rows 1000000 --output benchmarks/data/1M
+    python benchmarks/synthetic_data.py --rows 100000 --months 3 --match-rate 0.9
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+CENTROS = [
+    ("G601", "GUATEMALA", "SI"), ("G602", "GUATEMALA", "SI"), ("G610", "GUATEMALA", "NO"),
+    ("P100", "PAN - MODELO", "SI"), ("P110", "PAN - MODELO", "SI"),
+    ("H200", "TEGUCIPALPA", "SI"), ("H210", "TEGUCIPALPA", "NO"),
+    ("S300", "SAN SALVADOR", "SI"), ("N400", "MANAGUA", "SI"), ("C500", "SAN JOSE", "SI"),
+]
+CANALES = [(10, "RETAIL"), (20, "WHOLESALE"), (30, "B2B")]
+TIPOS_FACTURA = [("ZFAC", "SI"), ("ZSER", "NO"), ("ZDEV", "NO"), ("ZNC", "NO")]
+SEGMENTOS = ["SEG-A", "SEG-B", "SEG-C", "SEG-D"]
+
+# Article code families (prefix, digits, share of the catalogue), following the CLASIFICACION prefix rules
+FAMILIAS = [
+    ("1", 4, 0.35), ("2", 4, 0.15), ("10074", 2, 0.05), ("956", 3, 0.03), ("0", 4, 0.07), ("D", 5, 0.05),
+    ("8", 4, 0.04), ("9", 4, 0.04), ("E0000", 5, 0.12), ("SER", 6, 0.06), ("O", 5, 0.04),
+]
+
+SALES_COLUMNS = ["Centro", "Canal distribución", "Cliente", "Artículo", "Clase de factura",
+                 "Período/Año", "Volumen de ventas", "Valor Neto", "SEGMENTO"]
+EXCEL_MAX_DATA_ROWS = 1048575
+
+
+def make_materials(rng, count):
+    weights = np.array([weight for _, _, weight in FAMILIAS])
+    codes = set()
+    for family in rng.choice(len(FAMILIAS), size=count, p=weights / weights.sum()):
+        prefix, digits, _ = FAMILIAS[family]
+        codes.add(f"{prefix}{int(rng.integers(0, 10 ** digits)):0{digits}d}-0{int(rng.integers(1, 6))}")
+    return sorted(codes)
+
+
+def make_dimensions(rng, materials, clients):
+    """Rows of every Background.xlsx sheet, as {sheet: (header, rows)}."""
+    paises = sorted({pais for _, pais, _ in CENTROS})
+    sheets = {
+        "CANAL": (["CANAL_ID", "CANAL_DESCRIP"], [[code, name] for code, name in CANALES]),
+        "CENTROS": (["CENTRO", "PAIS_2", "CENTRO_ID", "FILTRO_CENTRO"],
+                    [[centro, pais, centro, filtro] for centro, pais, filtro in CENTROS]),
+        "TIPO_FACTURAS": (["TIPO_FACTURA", "VENTA_BRUTA"], [list(row) for row in TIPOS_FACTURA]),
+        "CLIENTES": (["Deudor", "Nombre_1"], [[client, f"CLIENTE {client}"] for client in clients]),
+        "MARA": (["Material", "Texto_breve_de_material", "Volumen"],
+                 [[code, f"MATERIAL {code}", None if rng.random() < 0.05 else round(float(rng.choice([0.25, 1, 4, 5, 19])), 2)]
+                  for code in materials]),
+    }
+
+    sampled = rng.choice(len(materials), size=max(1, len(materials) // 20), replace=False)
+    sheets["CODIGOS_CAMBIAN"] = (["CODIGO_SER", "CODIGO_PT"], [
+        # Some service codes come with blanks around them, the ingestion schema strips them
+        [f" {materials[i]} " if n % 3 == 0 else materials[i], materials[int(rng.integers(len(materials)))]]
+        for n, i in enumerate(sampled)
+    ])
+    sheets["SEGMENTO_CODIGO"] = (["MATERIAL", "SEGMENTO"], [
+        [materials[i], str(rng.choice(SEGMENTOS))] for i in rng.choice(len(materials), size=len(materials) // 4, replace=False)
+    ])
+    sheets["SEGMENTO_CLIENTE"] = (["PAIS_CANAL_ID_CLIENTE", "SEGMENTO_CLIENTE"], [
+        [f"{rng.choice(paises)}{rng.choice([code for code, _ in CANALES])}{clients[i]}", str(rng.choice(SEGMENTOS))]
+        for i in rng.choice(len(clients), size=len(clients) // 4, replace=False)
+    ])
+    sheets["WALMART_ESA_MASTER_PACK"] = (["CODIGO_SAP", "MASTERPACK_COMERCIAL"], [
+        [materials[i], int(rng.choice([4, 6, 12, 24]))] for i in rng.choice(len(materials), size=len(materials) // 10, replace=False)
+    ])
+    return sheets
+
+
+def write_workbook(path, sheets):
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    for name, (header, rows) in sheets.items():
+        sheet = workbook.create_sheet(name)
+        sheet.append(header)
+        for row in rows:
+            sheet.append(row)
+    workbook.save(path)
+
+
+def sales_rows(rng, rows, period, materials, clients, match_rate):
+    """Columns of one monthly file.
+
+    Each of Cliente, Artículo and Centro is missing from its dimension with probability
+    1 - match_rate. A few clients and articles take most of the sales, as in the real history.
+    """
+    def keys(known, unknown, skewed=True):
+        if skewed:
+            positions = np.minimum((rng.pareto(1.2, size=rows) * len(known) / 20).astype(int), len(known) - 1)
+        else:
+            positions = rng.integers(0, len(known), size=rows)
+        values = np.asarray(known, dtype=object)[positions]
+        missing = rng.random(rows) >= match_rate
+        values[missing] = [unknown(i) for i in rng.integers(0, 1000, size=int(missing.sum()))]
+        return values.tolist()
+
+    return [
+        keys([centro for centro, _, _ in CENTROS], lambda i: f"Z{i:03d}", skewed=False),
+        rng.choice([code for code, _ in CANALES], size=rows, p=[0.5, 0.3, 0.2]).tolist(),
+        keys(clients, lambda i: 900000000 + int(i)),
+        keys(materials, lambda i: f"X{i:05d}-09"),
+        rng.choice([code for code, _ in TIPOS_FACTURA], size=rows, p=[0.8, 0.1, 0.05, 0.05]).tolist(),
+        [period] * rows,
+        rng.integers(1, 500, size=rows).tolist(),
+        np.round(rng.uniform(1, 5000, size=rows), 2).tolist(),
+        rng.choice(SEGMENTOS, size=rows).tolist(),
+    ]
+
+
+def write_sales_file(path, columns):
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append(SALES_COLUMNS)
+    for row in zip(*columns):
+        sheet.append(row)
+    workbook.save(path)
+
+
+def generate(output, rows, months=12, match_rate=0.97, seed=0):
+    """Write Background.xlsx and Historial_de_Venta/VENTA-<year>-<month>.XLSX under `output`."""
+    if not 0 <= match_rate <= 1:
+        raise ValueError("match_rate must be between 0 and 1")
+    if -(-rows // months) > EXCEL_MAX_DATA_ROWS:
+        raise ValueError(f"{rows:,} rows in {months} files exceed the rows of an Excel sheet, use more months")
+
+    rng = np.random.default_rng(seed)
+    materials = make_materials(rng, max(200, min(20000, rows // 50)))
+    clients = sorted(set(int(c) for c in rng.integers(100000, 999999999, size=max(100, min(100000, rows // 20)))))
+    clients.append(110004493)
+
+    os.makedirs(os.path.join(output, "Historial_de_Venta"), exist_ok=True)
+    write_workbook(os.path.join(output, "Background.xlsx"), make_dimensions(rng, materials, clients))
+
+    for month in range(months):
+        count = rows // months + (1 if month < rows % months else 0)
+        year, number = 2024 + month // 12, month % 12 + 1
+        period = f"{number:03d}.{year}"
+        write_sales_file(os.path.join(output, "Historial_de_Venta", f"VENTA-{year}-{number:02d}.XLSX"),
+                         sales_rows(rng, count, period, materials, clients, match_rate))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000, help="Sales rows across all the monthly files")
+    parser.add_argument("--months", type=int, default=12, help="Number of monthly files")
+    parser.add_argument("--match-rate", type=float, default=0.97,
+                        help="Share of sales keys that exist in the dimension sheets")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join("benchmarks", "data"))
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generate(args.output, args.rows, args.months, args.match_rate, args.seed)
+    print(f"{args.rows:,} rows in {args.months} files written to {args.output} "
+          f"in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 from src import MODEL
 
-import sys
 import pandas as pd
+import numpy as np
 from tqdm import tqdm
 import time
 import os
@@ -32,415 +32,365 @@ def creat_list_of_tables_from_str_list(processor: MODEL.TableProcessor, string_l
 
 #----------------------------------------------------
 
+# Each step is a list of AddColumns column definitions applied in order. The same
+# definitions run on pandas (sub_add_*) and inside SQLite (_completarVentaHistoricaSQL).
+
+PASO_PAIS = [
+    {'PAIS': {
+        'source_table': 'CENTROS',
+        'join_on': 'CENTRO',
+        'join_target': 'Centro',
+        'source_column': 'PAIS_2'
+    }}
+]
+
+PASO_CENTROS = [
+    {'CENTRO_FINAL': {
+        'source_table': 'CENTROS',
+        'join_on': 'CENTRO',
+        'join_target': 'Centro',
+        'source_column': 'CENTRO_ID'
+    }}
+]
+
+PASO_CANAL = [
+    {'CANAL': {
+        'source_table': 'CANAL',
+        'join_on': 'CANAL_ID',
+        'join_target': 'Canal distribución',
+        'source_column': 'CANAL_DESCRIP'
+    }},
+    {'CANAL': {
+        'case': [
+            ([('eq', 'Canal distribución', "20"), ('eq', 'CENTRO_FINAL', "G601")], "WHOLESALE DEFERRET"),
+            ([('eq', 'PAIS', "PAN - MODELO")], "B2B-RETAIL-WHOLESALE"),
+        ],
+        'default': {'column': 'CANAL'}
+    }}
+]
+
+PASO_CLIENTE_DESCRPCION = [
+    {'CLIENTE_DESCRPCION': {
+        'source_table': 'CLIENTES',
+        'join_on': 'Deudor',
+        'join_target': 'Cliente',
+        'source_column': 'Nombre_1'
+    }}
+]
+
+PASO_CLASIFICACION = [
+    {'CLASIFICACION': {
+        'column': 'Artículo',
+        'prefix_rules': [
+            {'label': "PROYECTOS B2B", 'where': {"Canal distribución": "30", "Clase de factura": "ZSER"}},
+            {'label': "DEFERRET", 'prefixes': ("10074", "956", "951")},
+            {'label': "PINTURA", 'prefixes': ("1", "2")},
+            {'label': "APLICADORES", 'prefixes': ("0",)},
+            {'label': "MP", 'prefixes': ("D",)},
+            {'label': "MERCADEO", 'prefixes': ("8",)},
+            {'label': "LIQUIDACIÓN", 'prefixes': ("9",)},
+            {'label': "EMPAQUE", 'first_chars': ["E", "L", "C", "A", "B", "F", "H", "I", "N", "T", "J"]},
+            {'label': "SERVICIO", 'prefixes': ("S",)},
+            {'label': "INSUMO", 'prefixes': ("O", "R")},
+        ],
+        'default': "DEFERRET"
+    }}
+]
+
+PASO_FAMILIA = [
+    {'FAMILIA': {
+        'case': [],
+        'default': "---"
+    }}
+]
+
+PASO_LINEA = [
+    {'LINEA': {
+        'case': [],
+        'default': {'column': 'Artículo', 'substr': 5}
+    }}
+]
+
+PASO_MATERIAL = [
+    {'MATERIAL': {
+        'source_table': 'CODIGOS_CAMBIAN',
+        'join_on': 'CODIGO_SER',
+        'join_target': 'Artículo',
+        'source_column': 'CODIGO_PT'
+    }},
+    {'MATERIAL': {
+        'case': [
+            ([('eq', 'CLASIFICACION', "PROYECTOS B2B")], "SER000306-03"),
+            ([('concat_eq', ['PAIS', 'CANAL', 'CLASIFICACION'], "GUATEMALARETAILSERVICIO")], "SER000306-03"),
+            ([('isna', 'MATERIAL')], {'column': 'Artículo'}),
+        ],
+        'default': {'column': 'MATERIAL'}
+    }}
+]
+
+PASO_SEGMENTO = [
+    {'PAIS_CANAL_ID_CLIENTE': {
+        'case': [
+            ([('isna', 'PAIS')], None),
+            ([('isna', 'Canal distribución')], None),
+            ([('isna', 'Cliente')], None),
+        ],
+        'default': {'concat': ['PAIS', 'Canal distribución', 'Cliente']}
+    }},
+    {'SEGMENTO_CLIENTE': {
+        'source_table': 'SEGMENTO_CLIENTE',
+        'join_on': 'PAIS_CANAL_ID_CLIENTE',
+        'join_target': 'PAIS_CANAL_ID_CLIENTE',
+        'source_column': 'SEGMENTO_CLIENTE'
+    }},
+    {'SEGMENTO_CODIGO': {
+        'source_table': 'SEGMENTO_CODIGO',
+        'join_on': 'MATERIAL',
+        'join_target': 'Artículo',
+        'source_column': 'SEGMENTO'
+    }},
+    {'SEGMENTO_FINAL': {
+        'case': [
+            ([('notna', 'SEGMENTO_CLIENTE')], {'column': 'SEGMENTO_CLIENTE'}),
+            ([('notna', 'SEGMENTO_CODIGO')], {'column': 'SEGMENTO_CODIGO'}),
+        ],
+        'default': {'column': 'CLASIFICACION'}
+    }}
+]
+
+# Helper columns used by the steps and removed from the final table
+COLUMNAS_TEMPORALES = ['PAIS_CANAL_ID_CLIENTE']
+
+PASO_DESCRIPTION = [
+    {'DESCRIPTION': {
+        'source_table': 'MARA',
+        'join_on': 'Material',
+        'join_target': 'MATERIAL',
+        'source_column': 'Texto_breve_de_material'
+    }}
+]
+
+PASO_VALIDACION_COD = [
+    {'VALIDACION_COD': {
+        'case': [
+            ([('eq_col', 'Artículo', 'MATERIAL')], "True"),
+        ],
+        'default': "False"
+    }}
+]
+
+PASO_VOLUMEN = [
+    {'VOLUMEN': {
+        'source_table': 'MARA',
+        'join_on': 'Material',
+        'join_target': 'MATERIAL',
+        'source_column': 'Volumen'
+    }},
+    {'VOLUMEN': {
+        'case': [
+            ([('isna', 'VOLUMEN')], 0),
+            ([('eq', 'VOLUMEN', "None")], 0),
+        ],
+        'default': {'column': 'VOLUMEN'}
+    }}
+]
+
+PASO_UNIDADES = [
+    {'UNIDADES': {
+        'source_table': 'WALMART_ESA_MASTER_PACK',
+        'join_on': 'CODIGO_SAP',
+        'join_target': 'MATERIAL',
+        'source_column': 'MASTERPACK_COMERCIAL'
+    }},
+    {'UNIDADES': {
+        'case': [
+            ([('eq', 'MATERIAL', "NA")], 0),
+            ([('eq', 'PAIS', "GUATEMALA"), ('eq', 'CANAL', "RETAIL"), ('eq', 'LINEA', "500-0")],
+                {'expr': "`Volumen de ventas` / 2036"}),
+            ([('eq', 'Cliente', "110004493"), ('isna', 'UNIDADES')], {'expr': "`Volumen de ventas` * 0"}),
+            ([('eq', 'Cliente', "110004493")], {'expr': "UNIDADES * `Volumen de ventas`"}),
+        ],
+        'default': {'column': 'Volumen de ventas'}
+    }}
+]
+
+PASO_MONTO_USD = [
+    {'MONTO_USD': {
+        'case': [
+            ([('eq', 'MATERIAL', "NA")], 0),
+        ],
+        'default': {'column': 'Valor Neto'}
+    }}
+]
+
+PASO_GALONES = [
+    {'GALONES': {
+        'case': [
+            ([('isna', 'UNIDADES')], 0),
+            ([('isna', 'VOLUMEN')], 0),
+        ],
+        'default': {'expr': "UNIDADES * VOLUMEN"}
+    }}
+]
+
+PASO_FILTRO1 = [
+    {'FILTRO1': {
+        'case': [
+            ([('in', 'CLASIFICACION', ["PINTURA", "PROYECTOS B2B", "APLICADORES", "DEFERRET"])], "SI"),
+            ([('concat_in', ['PAIS', 'CLIENTE_DESCRPCION', 'MATERIAL'], [
+                "TEGUCIPALPAGRUPO DEWARE S.AE000000000-01",
+                "TEGUCIPALPAGRUPO DEWARE S.AE000000025-05",
+                "TEGUCIPALPAGRUPO DEWARE S.AE000000000-04"
+            ], '')], "SI"),
+            ([('concat_eq', ['PAIS', 'CANAL', 'CLASIFICACION'], "GUATEMALARETAILSERVICIO")], "SI"),
+        ],
+        'default': "NO"
+    }}
+]
+
+PASO_FILTRO2 = [
+    {'FILTRO2': {
+        'source_table': 'TIPO_FACTURAS',
+        'join_on': 'TIPO_FACTURA',
+        'join_target': 'Clase de factura',
+        'source_column': 'VENTA_BRUTA'
+    }}
+]
+
+PASO_FILTRO3 = [
+    {'FILTRO3': {
+        'source_table': 'CENTROS',
+        'join_on': 'CENTRO',
+        'join_target': 'Centro',
+        'source_column': 'FILTRO_CENTRO'
+    }}
+]
+
+PASO_FILTRO4 = [
+    {'FILTRO4': {
+        'case': [
+            ([('concat_eq', ['FILTRO1', 'FILTRO2', 'FILTRO3'], "SISISI")], "SI"),
+        ],
+        'default': "NO"
+    }}
+]
+
+def _agregarColumnas(df, processor: MODEL.TableProcessor, paso):
+    for column_definitions in paso:
+        df = processor.AddColumns(
+            df=df,
+            table_name='VentaHistoricaTOTAL',
+            column_definitions=column_definitions,
+            save_to_db=False
+        )
+    return df
+
 def sub_add_PAIS(df, processor: MODEL.TableProcessor):
-    centros_df = processor.GetTables('CENTROS')
-
-    return processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={'PAIS': {
-                'source_table': 'CENTROS',
-                'join_on': 'CENTRO',
-                'join_target': 'Centro',
-                'source_column': 'PAIS_2'
-            }
-        },
-        source_tables={'CENTROS': centros_df},
-        save_to_db=False 
-    )
+    return _agregarColumnas(df, processor, PASO_PAIS)
 
 def sub_add_CENTROS(df, processor: MODEL.TableProcessor):
-    centros_df = processor.GetTables('CENTROS')
-
-    return processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={'CENTRO_FINAL': {
-            'source_table': 'CENTROS',
-            'join_on': 'CENTRO',
-            'join_target': 'Centro', 
-            'source_column': 'CENTRO_ID'       
-            }
-        },
-        source_tables={'CENTROS': centros_df},
-        save_to_db=False
-    )
+    return _agregarColumnas(df, processor, PASO_CENTROS)
 
 def sub_add_CANAL(df, processor: MODEL.TableProcessor):
-    canal_df = processor.GetTables('CANAL')
-
-    df = processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={
-            'CANAL': {
-                'source_table': 'CANAL',
-                'join_on': 'CANAL_ID',
-                'join_target': 'Canal distribución',
-                'source_column': 'CANAL_DESCRIP'
-            }
-        },
-        source_tables={'CANAL': canal_df},
-        save_to_db=False
-    )
-
-    df['CANAL'] = df.apply(
-        lambda row: (
-            "WHOLESALE DEFERRET"
-            if str(row['Canal distribución']) == "20" and row['CENTRO_FINAL'] == "G601"
-            else "B2B-RETAIL-WHOLESALE" if row['PAIS'] == "PAN - MODELO"
-            else row['CANAL']
-        ),
-        axis=1
-    )
-    return df
+    return _agregarColumnas(df, processor, PASO_CANAL)
 
 def sub_add_CLIENTE_DESCRPCION(df, processor: MODEL.TableProcessor):
-    clientes_df = processor.GetTables('CLIENTES')
-
-    return processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={'CLIENTE_DESCRPCION': {
-            'source_table': 'CLIENTES',
-            'join_on': 'Deudor',
-            'join_target': 'Cliente', 
-            'source_column': 'Nombre_1'       
-            }
-        },
-        source_tables={'CLIENTES': clientes_df},
-        save_to_db=False
-    )
+    return _agregarColumnas(df, processor, PASO_CLIENTE_DESCRPCION)
 
 def sub_add_CLASIFICACION(df, processor: MODEL.TableProcessor):
-    
-    return processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={
-            'CLASIFICACION': lambda row: (
-                "PROYECTOS B2B" if str(row["Canal distribución"]) == "30" and str(row["Clase de factura"]) == "ZSER"
-                else "DEFERRET" if str(row["Artículo"]).startswith(("10074", "956", "951"))
-                else "PINTURA" if str(row["Artículo"]).startswith(("1", "2"))
-                else "APLICADORES" if str(row["Artículo"]).startswith("0")
-                else "MP" if str(row["Artículo"]).startswith("D")
-                else "MERCADEO" if str(row["Artículo"]).startswith("8")
-                else "LIQUIDACIÓN" if str(row["Artículo"]).startswith("9")
-                else "EMPAQUE" if str(row["Artículo"])[0] in ["E", "L", "C", "A", "B", "F", "H", "I", "N", "T", "J"]
-                else "SERVICIO" if str(row["Artículo"]).startswith("S")
-                else "INSUMO" if str(row["Artículo"]).startswith(("O", "R"))
-                else "DEFERRET"
-            )
-        },
-        save_to_db=False
-    )
+    return _agregarColumnas(df, processor, PASO_CLASIFICACION)
 
 def sub_add_FAMILIA(df, processor: MODEL.TableProcessor):
-    
-    return processor.AddColumns(
-    df=df,
-    table_name='VentaHistoricaTOTAL',
-    column_definitions={
-        'FAMILIA': lambda row: (
-            "---" if True
-            else "---"
-        )
-    },
-    save_to_db=False
-)
+    return _agregarColumnas(df, processor, PASO_FAMILIA)
 
 def sub_add_LINEA(df, processor: MODEL.TableProcessor):
-    
-    return processor.AddColumns(
-    df=df,
-    table_name='VentaHistoricaTOTAL',
-    column_definitions={
-        'LINEA': lambda row: (
-            str(row['Artículo'])[:5]
-        )
-    },
-    save_to_db=False
-)
+    return _agregarColumnas(df, processor, PASO_LINEA)
 
 def sub_add_MATERIAL(df, processor: MODEL.TableProcessor):
-    
-    codigosCambian_df = processor.GetTables('CODIGOS_CAMBIAN')
-    codigosCambian_df['CODIGO_SER'] = codigosCambian_df['CODIGO_SER'].astype(str).str.strip()
-
-    df = processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={'MATERIAL': {
-                'source_table': 'CODIGOS_CAMBIAN',
-                'join_on': 'CODIGO_SER',
-                'join_target': 'Artículo',  
-                'source_column': 'CODIGO_PT'  
-            }
-        },
-        source_tables={'CODIGOS_CAMBIAN': codigosCambian_df},
-        save_to_db=False
-    )
-
-    df['MATERIAL'] = df.apply(
-        lambda row: 
-        "SER000306-03" if str(row['CLASIFICACION']) == "PROYECTOS B2B"
-        else "SER000306-03" if str(row['PAIS']) + str(row['CANAL']) + str(row['CLASIFICACION']) == "GUATEMALARETAILSERVICIO"
-        else row['Artículo'] if pd.isna(row['MATERIAL'])
-        else row['MATERIAL'],
-        axis=1
-    )
-
-    return df
+    return _agregarColumnas(df, processor, PASO_MATERIAL)
 
 def sub_add_SEGMENTO(df, processor: MODEL.TableProcessor):
-
-    segmentoCliente_df = processor.GetTables('SEGMENTO_CLIENTE')
-    segmentoCodigo_df = processor.GetTables('SEGMENTO_CODIGO')
-
-    df['PAIS_CANAL_ID_CLIENTE'] = df['PAIS'] + df['Canal distribución'] + df['Cliente']
-
-    df = processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={'SEGMENTO_CLIENTE': {
-                'source_table': 'SEGMENTO_CLIENTE',
-                'join_on': 'PAIS_CANAL_ID_CLIENTE',
-                'join_target': 'PAIS_CANAL_ID_CLIENTE',  
-                'source_column': 'SEGMENTO_CLIENTE'  
-            }
-        },
-        source_tables={'SEGMENTO_CLIENTE': segmentoCliente_df},
-        save_to_db=False
-    )
-
-    df = processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={'SEGMENTO_CODIGO': {
-                'source_table': 'SEGMENTO_CODIGO',
-                'join_on': 'MATERIAL',
-                'join_target': 'Artículo',  
-                'source_column': 'SEGMENTO'  
-            }
-        },
-        source_tables={'SEGMENTO_CODIGO': segmentoCodigo_df},
-        save_to_db=False
-    )
-
-    df['SEGMENTO_FINAL'] = df['SEGMENTO_CLIENTE'].fillna(df['SEGMENTO_CODIGO']).fillna(df['CLASIFICACION'])
-
-    df.drop(columns=['PAIS_CANAL_ID_CLIENTE'], inplace=True)
-
-    return df
+    df = _agregarColumnas(df, processor, PASO_SEGMENTO)
+    return df.drop(columns=COLUMNAS_TEMPORALES)
 
 def sub_add_DESCRIPTION(df, processor: MODEL.TableProcessor):
-    mara_df = processor.GetTables('MARA')
-
-    return processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={
-            'DESCRIPTION': {
-            'source_table': 'MARA',
-            'join_on': 'Material',
-            'join_target': 'MATERIAL', 
-            'source_column': 'Texto_breve_de_material'       
-            }
-        },
-
-        source_tables={
-            'MARA': mara_df
-        },
-        save_to_db= False
-    )
+    return _agregarColumnas(df, processor, PASO_DESCRIPTION)
 
 def sub_add_VALIDACION_COD(df, processor: MODEL.TableProcessor):
-    return processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={
-            'VALIDACION_COD': lambda row: (
-                str(str(row['Artículo']) == str(row['MATERIAL']))
-            )
-        },
-        save_to_db=False
-    )
+    return _agregarColumnas(df, processor, PASO_VALIDACION_COD)
 
 def sub_add_VOLUMEN(df, processor: MODEL.TableProcessor):
-    mara_df = processor.GetTables('MARA')
-
-    df = processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={
-            'VOLUMEN': {
-            'source_table': 'MARA',
-            'join_on': 'Material',
-            'join_target': 'MATERIAL', 
-            'source_column': 'Volumen'       
-            }
-        },
-
-        source_tables={
-            'MARA': mara_df
-        },
-        save_to_db=False
-    )
+    return _agregarColumnas(df, processor, PASO_VOLUMEN)
 
-    df['VOLUMEN'] = df.apply(
-        lambda row: 
-        0 if pd.isna(row['VOLUMEN']) or row['VOLUMEN'] == None or row['VOLUMEN'] == "None"
-        else row['VOLUMEN'],
-        axis=1
-    )
-    return df
-    
 def sub_add_UNIDADES(df, processor: MODEL.TableProcessor):
-    walmart_df = processor.GetTables('WALMART_ESA_MASTER_PACK')
-
-    df = processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={
-            'UNIDADES': {
-                'source_table': 'WALMART_ESA_MASTER_PACK',
-                'join_on': 'CODIGO_SAP',
-                'join_target': 'MATERIAL',
-                'source_column': 'MASTERPACK_COMERCIAL'
-            }
-        },
-        source_tables={
-            'WALMART_ESA_MASTER_PACK': walmart_df
-        },
-        save_to_db=False
-    )
-
-    def calcular_unidades(row):
-        if row['MATERIAL'] == "NA":
-            return 0
-        elif row['PAIS'] == "GUATEMALA" and row['CANAL'] == "RETAIL" and row['LINEA'] == "500-0":
-            return row['Volumen de ventas'] / 2036
-        elif row['Cliente'] == "110004493":
-            unidades_base = 0 if pd.isna(row['UNIDADES']) else row['UNIDADES']
-            return unidades_base * row['Volumen de ventas']
-        else:
-            return row['Volumen de ventas']
-
-    df['UNIDADES'] = df.apply(calcular_unidades, axis=1)
-
-    return df
+    return _agregarColumnas(df, processor, PASO_UNIDADES)
 
 def sub_add_MONTO_USD(df, processor: MODEL.TableProcessor):
-    return processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={
-            'MONTO_USD': lambda row: (
-                0 if str(row["MATERIAL"]) ==  "NA"
-                else row['Valor Neto']
-            )
-        }, 
-        save_to_db=False
-    )
+    return _agregarColumnas(df, processor, PASO_MONTO_USD)
 
 def sub_add_GALONES(df, processor: MODEL.TableProcessor):
-    return processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={
-            'GALONES': lambda row: (
-                (row['UNIDADES'] if pd.notna(row['UNIDADES']) else 0) *
-                (row['VOLUMEN'] if pd.notna(row['VOLUMEN']) else 0)
-            )
-        }, 
-        save_to_db= False
-    )
+    return _agregarColumnas(df, processor, PASO_GALONES)
 
 def sub_add_FILTRO1(df, processor: MODEL.TableProcessor):
-    return processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={
-            'FILTRO1': lambda row: (
-                "SI" if row['CLASIFICACION'] in ["PINTURA", "PROYECTOS B2B", "APLICADORES", "DEFERRET"]
-                else "SI" if (
-                    (str(row['PAIS']) if pd.notna(row['PAIS']) else '') +
-                    (str(row['CLIENTE_DESCRPCION']) if pd.notna(row['CLIENTE_DESCRPCION']) else '') +
-                    (str(row['MATERIAL']) if pd.notna(row['MATERIAL']) else '')
-                ) in [
-                    "TEGUCIPALPAGRUPO DEWARE S.AE000000000-01",
-                    "TEGUCIPALPAGRUPO DEWARE S.AE000000025-05",
-                    "TEGUCIPALPAGRUPO DEWARE S.AE000000000-04"
-                ]
-                else "SI" if str(row['PAIS']) + str(row['CANAL']) + str(row['CLASIFICACION']) == "GUATEMALARETAILSERVICIO"
-                else "NO"
-            )
-        },
-        save_to_db=False
-    )
+    return _agregarColumnas(df, processor, PASO_FILTRO1)
 
 def sub_add_FILTRO2(df, processor: MODEL.TableProcessor):
-    tipoFacturas_df = processor.GetTables('TIPO_FACTURAS')
-
-    return processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={
-            'FILTRO2': {
-            'source_table': 'TIPO_FACTURAS',
-            'join_on': 'TIPO_FACTURA',
-            'join_target': 'Clase de factura', 
-            'source_column': 'VENTA_BRUTA'       
-            }
-        },
-
-        source_tables={
-            'TIPO_FACTURAS': tipoFacturas_df
-        },
-        save_to_db=False
-
-    )
+    return _agregarColumnas(df, processor, PASO_FILTRO2)
 
 def sub_add_FILTRO3(df, processor: MODEL.TableProcessor):
-    centros_df = processor.GetTables('CENTROS')
-
-    return processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={
-            'FILTRO3': {
-            'source_table': 'CENTROS',
-            'join_on': 'CENTRO',
-            'join_target': 'Centro', 
-            'source_column': 'FILTRO_CENTRO'       
-            }
-        },
-
-        source_tables={
-            'CENTROS': centros_df
-        },
-        save_to_db=False
-
-    )
+    return _agregarColumnas(df, processor, PASO_FILTRO3)
 
 def sub_add_FILTRO4(df, processor: MODEL.TableProcessor):
-   
-    return processor.AddColumns(
-        df=df,
-        table_name='VentaHistoricaTOTAL',
-        column_definitions={
-            'FILTRO4': lambda row: (
-                "SI" if str(row['FILTRO1']) + str(row['FILTRO2']) + str(row['FILTRO3'])== "SISISI"
-                else "NO"
-            )
-        },
-        save_to_db=False
-    )
-
+    return _agregarColumnas(df, processor, PASO_FILTRO4)
 
 
 #----------------------------------------------------
 
+# Indexes kept on each table: join keys of the dimensions and the columns reports filter or group by
+INDICES = {
+    'CANAL': ['CANAL_ID'],
+    'CENTROS': ['CENTRO'],
+    'CLIENTES': ['Deudor'],
+    'CODIGOS_CAMBIAN': ['CODIGO_SER'],
+    'SEGMENTO_CLIENTE': ['PAIS_CANAL_ID_CLIENTE'],
+    'SEGMENTO_CODIGO': ['MATERIAL'],
+    'MARA': ['Material'],
+    'WALMART_ESA_MASTER_PACK': ['CODIGO_SAP'],
+    'TIPO_FACTURAS': ['TIPO_FACTURA'],
+    'VentaHistoricaTOTAL': ['ORIGEN', 'Período/Año', 'FILTRO4'],
+    'CUBO_VENTAS': ['ORIGEN', 'FILTRO4'],
+}
+
+# Ingestion schemas: only these columns are read from Excel, with these types. Join keys are
+# 'key' (stripped text, 20.0 -> '20'), so the steps compare them without converting per row
+ESQUEMAS = {
+    'CANAL': {'CANAL_ID': 'key', 'CANAL_DESCRIP': 'text'},
+    'CENTROS': {'CENTRO': 'key', 'PAIS_2': 'text', 'CENTRO_ID': 'key', 'FILTRO_CENTRO': 'text'},
+    'CLIENTES': {'Deudor': 'key', 'Nombre_1': 'text'},
+    'CODIGOS_CAMBIAN': {'CODIGO_SER': 'key', 'CODIGO_PT': 'key'},
+    'SEGMENTO_CLIENTE': {'PAIS_CANAL_ID_CLIENTE': 'key', 'SEGMENTO_CLIENTE': 'text'},
+    'SEGMENTO_CODIGO': {'MATERIAL': 'key', 'SEGMENTO': 'text'},
+    'MARA': {'Material': 'key', 'Texto_breve_de_material': 'text', 'Volumen': 'real'},
+    'WALMART_ESA_MASTER_PACK': {'CODIGO_SAP': 'key', 'MASTERPACK_COMERCIAL': 'real'},
+    'TIPO_FACTURAS': {'TIPO_FACTURA': 'key', 'VENTA_BRUTA': 'text'},
+}
+
+# Schema of every monthly sales file in Historial_de_Venta
+ESQUEMA_VENTA = {
+    'Centro': 'key',
+    'Canal distribución': 'key',
+    'Cliente': 'key',
+    'Artículo': 'key',
+    'Clase de factura': 'key',
+    'Período/Año': 'text',
+    'Volumen de ventas': 'real',
+    'Valor Neto': 'real',
+    'SEGMENTO': 'text?',
+}
+
+# Tables read whole by the reports and the enrichment, served from a columnar snapshot when current
+SNAPSHOTS = ['VentaHistoricaTOTAL', 'CUBO_VENTAS']
+
 def _setUpDataBase(processor: MODEL.TableProcessor, excel_path: str):
     tablas = [
         "CANAL",
@@ -454,21 +404,43 @@ def _setUpDataBase(processor: MODEL.TableProcessor, excel_path: str):
         "WALMART_ESA_MASTER_PACK"
     ]
 
-    total = len(tablas)
-
     print("Iniciando carga de datos...\n")
-    for i, tabla in enumerate(tablas, 1):
-        processor.ImportFromExcel(excel_path, tabla, tabla)
-
-        porcentaje = int(100 * i / total)
-        barra = '#' * int(porcentaje / 2) + '-' * int((100 - porcentaje) / 2)
-        sys.stdout.write(f'\rCargando: [{barra}] {porcentaje}% ')
+    with processor.BulkLoad():
+        cargadas = processor.ImportSheetsFromExcel(excel_path, tablas)
 
+    for tabla, filas in cargadas.items():
+        print(f"    ∟ {tabla}: {filas:,} filas")
 
     print("\n Todas las tablas han sido cargadas correctamente...")
 
 #----------------------------------------------------
 
+# Directories for a cProfile dump and a JSON copy of every measured run (None skips them)
+CARPETA_PERFILES = None
+CARPETA_MEDICIONES = None
+
+def _medir(processor: MODEL.TableProcessor, nombre: str, funcion, *args):
+    # Runs an option inside a PerfRun, its calls and steps end up in the _perf_log table
+    with processor.PerfRun(nombre, profile_dir=CARPETA_PERFILES, json_dir=CARPETA_MEDICIONES) as run_id:
+        resultado = funcion(processor, *args)
+
+    reporte = processor.PerfReport(run_id)
+    total = reporte.loc[reporte['kind'] == 'run', 'wall_s'].sum()
+    print(f"\n[{run_id}] {nombre}: {total:.1f} s")
+    return resultado
+
+def _mostrarRendimiento(processor: MODEL.TableProcessor):
+    try:
+        reporte = processor.PerfReport()
+    except ValueError:
+        print("No hay ejecuciones medidas")
+        return
+    print(f"Ejecución {reporte['run_id'].iloc[0]} ({reporte['run_name'].iloc[0]})\n")
+    columnas = ['kind', 'name', 'depth', 'calls', 'wall_s', 'cpu_s', 'rss_peak_delta', 'rows_in', 'rows_out', 'bytes_out']
+    print(reporte[columnas].head(25).to_string(index=False))
+
+#----------------------------------------------------
+
 def _listDataBase(processor: MODEL.TableProcessor):
     for table in processor.ListTables():
         print(table)
@@ -500,7 +472,6 @@ def _deleteTableFromDataBase(processor: MODEL.TableProcessor):
 def _pivoteTabels(processor: MODEL.TableProcessor):
     table_name = input("[Tabla]: ")
     processor.PrintColumns(table_name)
-    table_name = processor.GetTables(table_name)
 
     index = input("[Index]: ").split()
     index = index if index != "" else None
@@ -517,136 +488,288 @@ def _pivoteTabels(processor: MODEL.TableProcessor):
 
 #----------------------------------------------------
 
-def _cargarVentaHistorica(processor: MODEL.TableProcessor):
+def _cargarVentaHistorica(processor: MODEL.TableProcessor, workers: int = None):
     
     directoryPath = "Historial_de_Venta"
     filesList = get_files_in_directory(directoryPath)
 
     print(filesList)
 
-    total = len(filesList)
-    porcentaje = 0
+    jobs = [
+        (os.path.join(directoryPath, table), "Sheet1", table.replace(".XLSX", "").replace("-", "_"))
+        for table in filesList
+    ]
 
-    for i, table in enumerate(filesList, 1):
+    with tqdm(total=len(jobs), desc="Cargando", unit="archivo") as barra:
+        def progreso(estado):
+            elapsed = max(estado['elapsed'], 1e-9)
+            barra.set_postfix(archivos_s=f"{estado['done'] / elapsed:.2f}", filas_s=f"{estado['rows_total'] / elapsed:,.0f}")
+            barra.update(1)
 
-        barra = '#' * int(porcentaje / 2) + '-' * int((100 - porcentaje) / 2)
-        sys.stdout.write(f'\rCargando: [{barra}] {porcentaje}% ')
+        with processor.BulkLoad():
+            resultados = processor.ImportManyFromExcel(jobs, max_workers=workers, progress=progreso,
+                                                      skip_unchanged=True, schema=ESQUEMA_VENTA)
 
-        processor.ImportFromExcel(f"{directoryPath}\\{table}","Sheet1",table.replace(".XLSX","").replace("-","_"))
-        
-        porcentaje = int(100 * i / total)
-        barra = '#' * int(porcentaje / 2) + '-' * int((100 - porcentaje) / 2)
-        sys.stdout.write(f'\rCargando: [{barra}] {porcentaje}% ')
+    errores = [r for r in resultados if r['status'] == 'failed']
+    for r in errores:
+        print(f" [ERROR] {r['path']}: {r['error']}")
 
-def _concatenateTabels(processor: MODEL.TableProcessor):
-
-    directoryPath = "Historial_de_Venta"
-    filesList = get_files_in_directory(directoryPath)
+    cargados = [r for r in resultados if r['status'] == 'loaded']
+    omitidos = [r for r in resultados if r['status'] == 'skipped']
+    print(f"\n{len(cargados)} archivos cargados ({sum(r['rows'] for r in cargados):,} filas), "
+          f"{len(omitidos)} sin cambios, {len(errores)} con errores")
 
+def _tablasVentaHistorica():
+    filesList = get_files_in_directory("Historial_de_Venta")
     filesList = replace_in_all_strings(filesList,".XLSX","")
-    filesList = replace_in_all_strings(filesList,"-","_")
-    filesList = creat_list_of_tables_from_str_list(processor,filesList)
+    return replace_in_all_strings(filesList,"-","_")
 
-    print(filesList[0])
+def _concatenateTabels(processor: MODEL.TableProcessor):
+
+    filesList = _tablasVentaHistorica()
 
     output_table = "VentaHistoricaTOTAL"
 
+    # Runs as INSERT ... SELECT inside SQLite, the monthly tables are not loaded into memory
     processor.ConcatTables(filesList,output_table)
+    print(f"{len(filesList)} tablas concatenadas en {output_table}")
+
+    # The cube summarized the previous enriched table
+    if processor.table_exists(CUBO_VENTAS):
+        processor.DropTable(CUBO_VENTAS, confirm=False)
+
+PASOS_VENTA_HISTORICA = [
+    ("PAIS", sub_add_PAIS, PASO_PAIS),
+    ("CENTRO_FINAL", sub_add_CENTROS, PASO_CENTROS),
+    ("CANAL", sub_add_CANAL, PASO_CANAL),
+    ("CLIENTE DESCRIPCION", sub_add_CLIENTE_DESCRPCION, PASO_CLIENTE_DESCRPCION),
+    ("CLASIFICACION", sub_add_CLASIFICACION, PASO_CLASIFICACION),
+    ("FAMILIA", sub_add_FAMILIA, PASO_FAMILIA),
+    ("LINEA", sub_add_LINEA, PASO_LINEA),
+    ("MATERIAL", sub_add_MATERIAL, PASO_MATERIAL),
+    ("SEGMENTO", sub_add_SEGMENTO, PASO_SEGMENTO),
+    ("DESCRIPTION", sub_add_DESCRIPTION, PASO_DESCRIPTION),
+    ("VALIDACION_COD", sub_add_VALIDACION_COD, PASO_VALIDACION_COD),
+    ("VOLUMEN", sub_add_VOLUMEN, PASO_VOLUMEN),
+    ("UNIDADES", sub_add_UNIDADES, PASO_UNIDADES),
+    ("MONTO_USD", sub_add_MONTO_USD, PASO_MONTO_USD),
+    ("GALONES", sub_add_GALONES, PASO_GALONES),
+    ("FILTRO1", sub_add_FILTRO1, PASO_FILTRO1),
+    ("FILTRO2", sub_add_FILTRO2, PASO_FILTRO2),
+    ("FILTRO3", sub_add_FILTRO3, PASO_FILTRO3),
+    ("FILTRO4", sub_add_FILTRO4, PASO_FILTRO4)
+]
+
+DIMENSIONES_REPORTE = ['PAIS', 'CANAL', 'CLASIFICACION', 'SEGMENTO', 'FAMILIA', 'LINEA', 'CENTRO_FINAL', 'MATERIAL', 'DESCRIPTION']
+
+# Sales already summed by every report dimension, period and filter flag; the reports roll up from it
+CUBO_VENTAS = 'CUBO_VENTAS'
+DIMENSIONES_CUBO = DIMENSIONES_REPORTE + ['Período/Año', 'FILTRO4']
+MEDIDAS_CUBO = ['UNIDADES', 'MONTO_USD', 'GALONES', 'Valor Neto']
+
+def _actualizarCuboVentas(processor: MODEL.TableProcessor, particiones=None):
+    try:
+        filas = processor.MaterializeAggregate('VentaHistoricaTOTAL', CUBO_VENTAS, DIMENSIONES_CUBO, MEDIDAS_CUBO,
+                                               partition_column='ORIGEN', partitions=particiones)
+        print(f"{CUBO_VENTAS} actualizado: {filas:,} grupos")
+    except ValueError as e:
+        print(f" [ERROR] No se pudo actualizar {CUBO_VENTAS}: {e}")
+
+def _definicionesVentaHistorica():
+    return [column_definitions for _, _, paso in PASOS_VENTA_HISTORICA for column_definitions in paso]
+
+def _pasosVentaHistorica(processor: MODEL.TableProcessor):
+    # The columns each step reads and writes come from its definitions; they decide what can run at the same time
+    pasos = []
+    for label, func, paso in PASOS_VENTA_HISTORICA:
+        lee, escribe = MODEL.step_columns(paso)
+        pasos.append({'name': label, 'func': lambda df, func=func: func(df, processor), 'reads': lee, 'writes': escribe})
+    return pasos
+
+def _ejecutarPasos(df, processor: MODEL.TableProcessor, mostrar: bool = True, hilos: int = None):
+    if not mostrar:
+        return processor.RunSteps(df, _pasosVentaHistorica(processor), max_workers=hilos)
+
+    with tqdm(total=len(PASOS_VENTA_HISTORICA), desc="Completando columnas", unit="columna") as barra:
+        def progreso(estado):
+            tqdm.write(f"✔ Completado: {estado['name']} ({estado['seconds']:.2f} s)")
+            barra.update(1)
+
+        inicio = time.perf_counter()
+        df = processor.RunSteps(df, _pasosVentaHistorica(processor), max_workers=hilos, progress=progreso)
+
+    print(f"Columnas completadas en {time.perf_counter() - inicio:.1f} s")
+    return df
+
+def _imprimirMemoria(processor: MODEL.TableProcessor, table_name: str):
+    memoria = processor.MemoryReport().get(table_name)
+    if memoria:
+        print(f"Memoria de {table_name}: {memoria['bytes_before'] / 1024 ** 2:,.1f} MB -> "
+              f"{memoria['bytes_after'] / 1024 ** 2:,.1f} MB")
+
+def _imprimirNoCoincidentes(processor: MODEL.TableProcessor, run_id: str):
+    # Only the joins of this run, an earlier run's keys would be misleading
+    diagnostico = processor.MergeDiagnostics(run_id)
+    if diagnostico.empty:
+        return
+    print("\nClaves sin coincidencia o duplicadas (detalle en MergeDiagnostics / _merge_diagnostics):")
+    for fila in diagnostico.itertuples(index=False):
+        tipo = "no coinciden" if fila.kind == 'unmatched' else "claves duplicadas en el origen"
+        print(f"    ∟ {fila.target_columns} <- {fila.source_table}.{fila.join_on}: "
+              f"{fila.rows:,} filas, {fila.distinct_keys:,} claves ({tipo})")
+
+def _completarVentaHistorica(processor: MODEL.TableProcessor, chunksize: int = None):
+    if chunksize:
+        return _completarVentaHistoricaPorBloques(processor, chunksize)
 
-def _completarVentaHistorica(processor: MODEL.TableProcessor):
     table_name = 'VentaHistoricaTOTAL'
+    run_id = processor.RunId()
     df = processor.GetTables(table_name)
-
-    steps = [
-        ("PAIS", sub_add_PAIS),
-        ("CENTRO_FINAL", sub_add_CENTROS),
-        ("CANAL", sub_add_CANAL),
-        ("CLIENTE DESCRIPCION", sub_add_CLIENTE_DESCRPCION),
-        ("CLASIFICACION", sub_add_CLASIFICACION),
-        ("FAMILIA", sub_add_FAMILIA),
-        ("LINEA", sub_add_LINEA),
-        ("MATERIAL", sub_add_MATERIAL),
-        ("SEGMENTO", sub_add_SEGMENTO),
-        ("DESCRIPTION", sub_add_DESCRIPTION),
-        ("VALIDACION_COD", sub_add_VALIDACION_COD),
-        ("VOLUMEN", sub_add_VOLUMEN),
-        ("UNIDADES", sub_add_UNIDADES),
-        ("MONTO_USD", sub_add_MONTO_USD),
-        ("GALONES", sub_add_GALONES),
-        ("FILTRO1", sub_add_FILTRO1),
-        ("FILTRO2", sub_add_FILTRO2),
-        ("FILTRO3", sub_add_FILTRO3),
-        ("FILTRO4", sub_add_FILTRO4)
-    ]
+    _imprimirMemoria(processor, table_name)
 
     print("\nProcesando columnas en VentaHistoricaTOTAL...\n")
 
-    for label, func in tqdm(steps, desc="Completando columnas", unit="columna"):
-        tqdm.write(f"▶ Ejecutando: {label}")
-        df = func(df, processor)
-        tqdm.write(f"✔ Completado: {label}")
-        print("------------------------------------------------")
-        time.sleep(0.1)
+    df = _ejecutarPasos(df, processor)
+    _imprimirNoCoincidentes(processor, run_id)
 
     # Save final result ONCE
-    df.to_sql(table_name, processor.conn, if_exists='replace', index=False)
+    with processor.BulkLoad():
+        processor.SetTable(table_name, df)
+    _actualizarCuboVentas(processor)
     print("\nProceso completado con éxito...\n")
 
+def _completarVentaHistoricaPorBloques(processor: MODEL.TableProcessor, chunksize: int = 250000):
+    # Runs the steps over blocks of rows, so memory depends on chunksize and not on the history length
+    table_name = 'VentaHistoricaTOTAL'
+    run_id = processor.RunId()
 
-def _pivotearDescargar_VENTA_BRUTA(processor: MODEL.TableProcessor):
-    df = processor.GetTables('VentaHistoricaTOTAL')
-    df = df[df['FILTRO4'] == 'SI']
+    print(f"\nProcesando columnas en {table_name} en bloques de {chunksize:,} filas...\n")
 
-    pivot_df = pd.pivot_table(
-        df,
-        index=['PAIS', 'CANAL', 'CLASIFICACION', 'SEGMENTO', 'FAMILIA', 'LINEA', 'CENTRO_FINAL', 'MATERIAL', 'DESCRIPTION'],
-        columns=['Período/Año'],
-        values=['UNIDADES', 'MONTO_USD', 'GALONES'],
-        aggfunc='sum',
-        fill_value=0  
-    )
+    with tqdm(desc="Completando filas", unit="fila") as barra:
+        def progreso(estado):
+            barra.total = estado['rows_total']
+            barra.update(estado['rows_done'] - barra.n)
 
-    pivot_df.columns = ['{}_{}'.format(val, col) for val, col in pivot_df.columns]
-    pivot_df = pivot_df.reset_index()
+        with processor.BulkLoad():
+            processor.TransformTableInChunks(
+                table_name,
+                lambda chunk: _ejecutarPasos(chunk, processor, mostrar=False),
+                chunksize=chunksize,
+                progress=progreso
+            )
 
-    processor.SetTable('pivot_result_BRUTA', pivot_df)
-    print(pivot_df)
-    processor.ExportToExcel(table_name='pivot_result_BRUTA', sheet_name="Sheet01")
+    _imprimirNoCoincidentes(processor, run_id)
+    _actualizarCuboVentas(processor)
+    print("\nProceso completado con éxito...\n")
 
-def _pivotearDescargar_VENTA_NETA(processor: MODEL.TableProcessor):
-    df = processor.GetTables('VentaHistoricaTOTAL')
+def _completarVentaHistoricaSQL(processor: MODEL.TableProcessor, output_table: str = None):
+    # Same steps compiled into one CREATE TABLE ... AS SELECT, the table never leaves SQLite
+    table_name = 'VentaHistoricaTOTAL'
 
-    pivot_df = pd.pivot_table(
-        df,
-        index=['PAIS', 'CANAL', 'CLASIFICACION', 'SEGMENTO', 'FAMILIA', 'LINEA', 'CENTRO_FINAL', 'MATERIAL', 'DESCRIPTION'],
-        columns=['Período/Año'],
-        values=['UNIDADES', 'MONTO_USD', 'GALONES'],
-        aggfunc='sum',
-        fill_value=0  
-    )
+    print(f"\nProcesando columnas en {table_name} dentro de SQLite...\n")
 
-    pivot_df.columns = ['{}_{}'.format(val, col) for val, col in pivot_df.columns]
-    pivot_df = pivot_df.reset_index()
+    inicio = time.perf_counter()
+    filas = processor.AddColumnsInSQL(table_name, _definicionesVentaHistorica(), output_table=output_table,
+                                      drop_columns=COLUMNAS_TEMPORALES)
 
-    processor.SetTable('pivot_result_NETA', pivot_df)
-    print(pivot_df)
-    processor.ExportToExcel(table_name='pivot_result_NETA', sheet_name="Sheet01")
+    print(f"\n{filas:,} filas procesadas en {time.perf_counter() - inicio:.1f} s")
+    if output_table is None:
+        _actualizarCuboVentas(processor)
+    print("\nProceso completado con éxito...\n")
 
-def _pivotearDescargar_VENTA_POR_CANAL(processor: MODEL.TableProcessor):
-    df = processor.GetTables('VentaHistoricaTOTAL')
+def _columnasDistintas(esperado: pd.DataFrame, obtenido: pd.DataFrame):
+    if list(esperado.columns) != list(obtenido.columns) or len(esperado) != len(obtenido):
+        return sorted(set(esperado.columns) ^ set(obtenido.columns)) or ['<estructura>']
+
+    distintas = []
+    for column in esperado.columns:
+        a = pd.to_numeric(esperado[column], errors='coerce')
+        b = pd.to_numeric(obtenido[column], errors='coerce')
+        if a.notna().equals(esperado[column].notna()) and b.notna().equals(obtenido[column].notna()):
+            iguales = np.isclose(a.to_numpy(dtype=float), b.to_numpy(dtype=float), equal_nan=True).all()
+        else:
+            iguales = esperado[column].astype(object).where(esperado[column].notna(), None).astype(str).equals(
+                obtenido[column].astype(object).where(obtenido[column].notna(), None).astype(str))
+        if not iguales:
+            distintas.append(column)
+    return distintas
+
+def _verificarVentaHistoricaSQL(processor: MODEL.TableProcessor):
+    # Runs both modes over the current table and reports the columns where they disagree
+    table_name = 'VentaHistoricaTOTAL'
+    output_table = 'VentaHistoricaTOTAL_SQL'
+
+    esperado = _ejecutarPasos(processor.GetTables(table_name), processor, mostrar=False)
+    processor.AddColumnsInSQL(table_name, _definicionesVentaHistorica(), output_table=output_table,
+                              drop_columns=COLUMNAS_TEMPORALES)
+    obtenido = processor.GetTables(output_table)
+    processor.DropTable(output_table, confirm=False)
+
+    distintas = _columnasDistintas(esperado, obtenido)
+    if distintas:
+        print(f"\n [ERROR] Las columnas no coinciden entre pandas y SQLite: {', '.join(distintas)}\n")
+    else:
+        print(f"\nLos dos modos coinciden en {len(esperado):,} filas y {len(esperado.columns)} columnas\n")
+    return distintas
+
+def _completarVentaHistoricaIncremental(processor: MODEL.TableProcessor):
+    # Each row keeps in ORIGEN the monthly table it came from, so only new or
+    # changed monthly tables go through the steps again
+    table_name = 'VentaHistoricaTOTAL'
+    partition_column = 'ORIGEN'
+
+    # A table built by the full pipeline has no ORIGEN column and cannot be updated by partition
+    if processor.table_exists(table_name) and partition_column not in processor.GetColumns(table_name):
+        processor.DropTable(table_name, confirm=False)
 
-    pivot_df = pd.pivot_table(
-        df,
-        index=['PAIS', 'CANAL'],
+    fuentes = {tabla: processor.TableFingerprint(tabla) for tabla in _tablasVentaHistorica() if processor.table_exists(tabla)}
+    pendientes = processor.PendingPartitions(table_name, partition_column, fuentes)
+    eliminadas = [tabla for tabla in processor.PartitionsRecorded(table_name) if tabla not in fuentes]
+
+    print(f"\n{len(pendientes)} tablas por completar, {len(fuentes) - len(pendientes)} sin cambios, {len(eliminadas)} eliminadas\n")
+
+    with processor.BulkLoad():
+        for tabla in eliminadas:
+            processor.UpsertPartition(table_name, pd.DataFrame(), partition_column, tabla)
+
+        for tabla in pendientes:
+            print(f"\nProcesando columnas en {tabla}...\n")
+            df = _ejecutarPasos(processor.GetTables(tabla), processor)
+            processor.UpsertPartition(table_name, df, partition_column, tabla, fuentes[tabla])
+
+    if pendientes or eliminadas or not processor.table_exists(CUBO_VENTAS):
+        _actualizarCuboVentas(processor, pendientes + eliminadas)
+    print("\nProceso completado con éxito...\n")
+    return pendientes
+
+def _pivotearDescargar(processor: MODEL.TableProcessor, output_table: str, index, values, filters=None):
+    # Rolls up from the sales cube, pandas only reshapes the groups
+    if not processor.table_exists(CUBO_VENTAS):
+        _actualizarCuboVentas(processor)
+
+    pivot_df = processor.PivotTables(
+        CUBO_VENTAS,
+        output_table,
+        rows=index,
         columns=['Período/Año'],
-        values=['Valor Neto', 'MONTO_USD', 'GALONES'],
+        values=values,
+        filters=filters,
         aggfunc='sum',
-        fill_value=0  
+        fill_value=0
     )
 
-    pivot_df.columns = ['{}_{}'.format(val, col) for val, col in pivot_df.columns]
-    pivot_df = pivot_df.reset_index()
-
-    processor.SetTable('pivot_venta_canal', pivot_df)
     print(pivot_df)
-    processor.ExportToExcel(table_name='pivot_venta_canal', sheet_name="Sheet01")
+    # The pivot is already in memory, it is written without reading the table back
+    processor.ExportToExcel(table_name=output_table, sheet_name="Sheet01", df=pivot_df)
+
+def _pivotearDescargar_VENTA_BRUTA(processor: MODEL.TableProcessor):
+    _pivotearDescargar(processor, 'pivot_result_BRUTA', DIMENSIONES_REPORTE,
+                       ['UNIDADES', 'MONTO_USD', 'GALONES'], filters={'FILTRO4': ['SI']})
+
+def _pivotearDescargar_VENTA_NETA(processor: MODEL.TableProcessor):
+    _pivotearDescargar(processor, 'pivot_result_NETA', DIMENSIONES_REPORTE,
+                       ['UNIDADES', 'MONTO_USD', 'GALONES'])
+
+def _pivotearDescargar_VENTA_POR_CANAL(processor: MODEL.TableProcessor):
+    _pivotearDescargar(processor, 'pivot_venta_canal', ['PAIS', 'CANAL'],
+                       ['Valor Neto', 'MONTO_USD', 'GALONES'])
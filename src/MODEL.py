@@ -1,18 +1,996 @@
 import pandas as pd
+import numpy as np
 import sqlite3
 import os
+import re
+import ast
+import time
+import sys
+import json
+import uuid
+import hashlib
+import cProfile
+import functools
+import threading
+import weakref
+from datetime import datetime
+from pathlib import Path
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 from typing import Callable, List, Union, Dict, Optional
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+#-------------------------------------------------------------------
+def _text_codes(values: pd.Series, na_rep: Optional[str] = None):
+    """Factorize a column into integer codes and the text form of each distinct value.
+
+    `labels[codes]` is the same as calling `str()` on every cell, but `str` only runs once
+    per distinct value. Missing cells get their own codes: 'nan'/'None' as `str` would
+    print them, or `na_rep` for all of them when it is given.
+    """
+    codes, uniques = pd.factorize(values)
+    labels = [str(value) for value in uniques]
+    missing = codes < 0
+
+    if missing.any():
+        codes = np.where(missing, len(labels), codes)
+        labels.append('nan' if na_rep is None else na_rep)
+        if na_rep is None and values.dtype == object:
+            is_none = np.zeros(len(codes), dtype=bool)
+            is_none[missing] = np.equal(values.to_numpy()[missing], None)
+            if is_none.any():
+                codes[is_none] = len(labels)
+                labels.append('None')
+
+    return codes, np.array(labels, dtype=object)
+
+def _labels_startwith(labels: np.ndarray, prefixes) -> np.ndarray:
+    """Boolean mask of the labels that start with any of the given prefixes."""
+    prefixes = (prefixes,) if isinstance(prefixes, str) else tuple(prefixes)
+    return np.fromiter((label.startswith(prefixes) for label in labels), dtype=bool, count=len(labels))
+
+def _text_equals(values: pd.Series, value: str) -> np.ndarray:
+    """Row mask equivalent to `str(cell) == value`."""
+    codes, labels = _text_codes(values)
+    return (labels == str(value))[codes]
+
+def _is_numeric(value) -> bool:
+    if isinstance(value, np.ndarray):
+        return value.dtype.kind in 'iuf'
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, bool)
+
+def _select(conditions: List[np.ndarray], choices: List, default, length: int) -> np.ndarray:
+    """`np.select` where the first matching condition wins, tolerant of mixed str/number choices."""
+    dtype = None if all(_is_numeric(v) for v in list(choices) + [default]) else object
+    choices = [np.asarray(choice, dtype=dtype) for choice in choices]
+    default = np.asarray(default, dtype=dtype)
+
+    if not conditions:
+        return np.broadcast_to(default, (length,)).copy()
+    return np.select(conditions, choices, default)
+
+def _concat_text_codes(df: pd.DataFrame, columns: List[str], na_rep: Optional[str] = None):
+    """Like `_text_codes` for the concatenated text of several columns.
+
+    The concatenation is only built for the distinct combinations actually present.
+    """
+    codes, labels = _text_codes(df[columns[0]], na_rep)
+    for column in columns[1:]:
+        next_codes, next_labels = _text_codes(df[column], na_rep)
+        width = len(next_labels)
+        codes, combos = pd.factorize(codes.astype(np.int64) * width + next_codes)
+        labels = np.array([labels[c // width] + next_labels[c % width] for c in combos], dtype=object)
+    return codes, labels
+
+def _evaluate_prefix_rules(df: pd.DataFrame, definition: Dict) -> np.ndarray:
+    """Evaluate a prefix rule table over a whole column at once.
+
+    Prefix and first-character tests are run once per distinct value of
+    `definition['column']`; equality conditions are compared on the text form of the cell.
+    The first rule that matches a row decides its label, as in an if/elif chain.
+    """
+    column = definition.get('column')
+    if column not in df.columns:
+        raise ValueError(f"Prefix column '{column}' not in DataFrame")
+
+    codes, labels = _text_codes(df[column])
+    conditions, choices = [], []
+
+    for rule in definition['prefix_rules']:
+        if 'label' not in rule:
+            raise ValueError(f"Prefix rule without 'label': {rule}")
+
+        hit = np.ones(len(labels), dtype=bool)
+        if 'prefixes' in rule:
+            hit &= _labels_startwith(labels, rule['prefixes'])
+        if 'first_chars' in rule:
+            first_chars = set(rule['first_chars'])
+            hit &= np.fromiter((label[:1] in first_chars for label in labels), dtype=bool, count=len(labels))
+
+        mask = hit[codes]
+        for where_col, where_value in rule.get('where', {}).items():
+            mask &= _text_equals(df[where_col], where_value)
+
+        conditions.append(mask)
+        choices.append(rule['label'])
+
+    return _select(conditions, choices, definition.get('default'), len(df))
+
+def _case_condition(df: pd.DataFrame, condition: tuple) -> np.ndarray:
+    """Row mask for one condition of a `case` definition.
+
+    Conditions are tuples:
+        ('eq', column, value)              - string values compare against `str(cell)`
+        ('in', column, values)             - same rule as 'eq', for a list of values
+        ('isna', column) / ('notna', column)
+        ('eq_col', column_a, column_b)     - `str(a) == str(b)`
+        ('prefix', column, prefixes)       - `str(cell).startswith(prefixes)`
+        ('concat_eq', columns, value[, na_rep])
+        ('concat_in', columns, values[, na_rep])
+                                           - `str(a) + str(b) + ...`, optionally with
+                                             missing cells written as `na_rep`
+    """
+    op, *args = condition
+
+    if op == 'eq':
+        column, value = args
+        if isinstance(value, str):
+            return _text_equals(df[column], value)
+        return (df[column] == value).to_numpy(dtype=bool, na_value=False)
+
+    if op == 'in':
+        column, values = args
+        if all(isinstance(value, str) for value in values):
+            codes, labels = _text_codes(df[column])
+            return np.isin(labels, list(values))[codes]
+        return df[column].isin(values).to_numpy(dtype=bool)
+
+    if op == 'isna':
+        return df[args[0]].isna().to_numpy()
+
+    if op == 'notna':
+        return df[args[0]].notna().to_numpy()
+
+    if op == 'eq_col':
+        left_codes, left_labels = _text_codes(df[args[0]])
+        right_codes, right_labels = _text_codes(df[args[1]])
+        return left_labels[left_codes] == right_labels[right_codes]
+
+    if op == 'prefix':
+        column, prefixes = args
+        codes, labels = _text_codes(df[column])
+        return _labels_startwith(labels, prefixes)[codes]
+
+    if op in ('concat_eq', 'concat_in'):
+        columns, target = args[0], args[1]
+        na_rep = args[2] if len(args) > 2 else None
+        codes, labels = _concat_text_codes(df, columns, na_rep)
+        targets = [target] if op == 'concat_eq' else list(target)
+        return np.isin(labels, targets)[codes]
+
+    raise ValueError(f"Unsupported condition: {condition}")
+
+def _case_value(df: pd.DataFrame, value):
+    """Result of a `case` branch: a literal, {'column': ...}, {'concat': ...} or {'expr': ...}.
+
+    {'column': name} may add `fillna` (replacement for missing cells) or `substr`
+    (keep the first n characters of the text form, like `str(cell)[:n]`).
+    {'concat': columns} joins the text form of the columns, with missing cells written
+    as the optional `na_rep`. {'expr': expression} is evaluated with `DataFrame.eval`.
+    """
+    if not isinstance(value, dict):
+        return value
+
+    if 'concat' in value:
+        codes, labels = _concat_text_codes(df, value['concat'], value.get('na_rep'))
+        return labels[codes]
+
+    if 'expr' in value:
+        result = df.eval(value['expr'])
+        return result.to_numpy() if isinstance(result, pd.Series) else result
+
+    if 'column' in value:
+        column = df[value['column']]
+        if 'substr' in value:
+            codes, labels = _text_codes(column)
+            return np.array([label[:value['substr']] for label in labels], dtype=object)[codes]
+        if 'fillna' in value:
+            column = column.fillna(value['fillna'])
+        return column.to_numpy()
+
+    raise ValueError(f"Unsupported case value: {value}")
+
+def _evaluate_case(df: pd.DataFrame, definition: Dict) -> pd.Series:
+    """Evaluate a CASE/WHEN definition with boolean masks over whole columns.
+
+    `definition['case']` is an ordered list of (conditions, value) pairs, where all the
+    conditions of a pair must hold; the first matching pair wins and rows that match
+    none get `definition['default']`.
+    """
+    conditions, choices = [], []
+    for when, then in definition['case']:
+        mask = np.ones(len(df), dtype=bool)
+        for condition in when:
+            mask &= _case_condition(df, condition)
+        conditions.append(mask)
+        choices.append(_case_value(df, then))
+
+    result = _select(conditions, choices, _case_value(df, definition.get('default')), len(df))
+    return pd.Series(result, index=df.index).infer_objects()
+
+class _LookupIndex:
+    """Hash index on the key column of a source table, used for left lookups.
+
+    The index is built once and every column requested through it is fetched with the
+    same row positions, so a lookup never copies or reshapes the target DataFrame.
+    Duplicate keys resolve to their first row instead of multiplying target rows.
+    With `normalize='strip'` the source keys are matched by their text form without
+    surrounding whitespace.
+    """
+
+    def __init__(self, source_df: pd.DataFrame, key: str, normalize: Optional[str] = None):
+        keys = source_df[key]
+        if normalize == 'strip':
+            codes, labels = _text_codes(keys)
+            keys = pd.Series(np.array([label.strip() for label in labels], dtype=object)[codes], index=keys.index)
+        elif normalize is not None:
+            raise ValueError(f"Unsupported key normalization: {normalize}")
+        first = ~keys.duplicated(keep='first').to_numpy()
+
+        self.frame = source_df
+        self.key = key
+        self.keys = keys
+        self.rows = np.flatnonzero(first)
+        self.index = pd.Index(keys[first])
+        self.has_duplicates = len(self.rows) < len(keys)
+
+    def positions(self, target: pd.Series) -> np.ndarray:
+        """Row position in the source for each target key, -1 where there is no match."""
+        found = self.index.get_indexer(target)
+        return np.where(found < 0, -1, self.rows[found])
+
+    def fetch(self, column: str, positions: np.ndarray):
+        """Values of a source column at the given positions, missing where position is -1."""
+        return self.frame[column].array.take(positions, allow_fill=True)
+
+    def conflicts(self, columns: List[str]) -> pd.Series:
+        """Duplicated keys whose rows disagree on any of the given columns."""
+        if not self.has_duplicates:
+            return pd.Series([], dtype=object, name=self.key)
+
+        mask = self.keys.duplicated(keep=False).to_numpy()
+        values = [col for col in columns if col != self.key]
+        duplicated = self.frame.loc[mask, values].assign(**{self.key: self.keys[mask]}).drop_duplicates()
+        conflicting = duplicated[self.key]
+        return conflicting[conflicting.duplicated()].drop_duplicates().reset_index(drop=True)
+
+_SQL_OPERATORS = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Mod: '%', ast.BitAnd: 'AND', ast.BitOr: 'OR'}
+_SQL_AGGREGATES = {'sum': ('SUM', 'sum'), 'mean': ('AVG', 'mean'), 'min': ('MIN', 'min'),
+                   'max': ('MAX', 'max'), 'count': ('COUNT', 'sum')}
+_SQL_COMPARISONS = {ast.Eq: '=', ast.NotEq: '<>', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>='}
+
+class _ReadLease:
+    """Read-only connection lent to one thread, back in the pool once the thread ends."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+def _sql_name(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _sql_literal(value) -> str:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return 'NULL'
+    if isinstance(value, (bool, np.bool_)):
+        return '1' if value else '0'
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        return repr(float(value))
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _sql_text(column: str, na_rep: Optional[str] = None) -> str:
+    """SQL for the text form of a column, as `_text_codes` gives it; missing cells read 'nan'."""
+    return f"COALESCE(CAST({_sql_name(column)} AS TEXT), {_sql_literal('nan' if na_rep is None else na_rep)})"
+
+def _sql_expression(expression: str, columns: List[str]) -> str:
+    """Translate an arithmetic `DataFrame.eval` expression to SQL.
+
+    Only column names (plain or `quoted`), numbers, strings, arithmetic, comparisons
+    and &/| are accepted. Division is done in floating point, as pandas does.
+    """
+    quoted = {}
+
+    def placeholder(match):
+        name = f"__column_{len(quoted)}"
+        quoted[name] = match.group(1)
+        return name
+
+    try:
+        tree = ast.parse(re.sub(r'`([^`]*)`', placeholder, expression), mode='eval')
+    except SyntaxError:
+        raise ValueError(f"Could not compile expression: {expression}")
+
+    def visit(node):
+        if isinstance(node, ast.Name):
+            column = quoted.get(node.id, node.id)
+            if column not in columns:
+                raise ValueError(f"Column '{column}' in expression '{expression}' does not exist")
+            return _sql_name(column)
+        if isinstance(node, ast.Constant) and not isinstance(node.value, bytes):
+            return _sql_literal(node.value)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            return f"({'-' if isinstance(node.op, ast.USub) else '+'}{visit(node.operand)})"
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Div):
+            return f"(CAST({visit(node.left)} AS REAL) / {visit(node.right)})"
+        if isinstance(node, ast.BinOp) and type(node.op) in _SQL_OPERATORS:
+            return f"({visit(node.left)} {_SQL_OPERATORS[type(node.op)]} {visit(node.right)})"
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _SQL_COMPARISONS:
+            return f"({visit(node.left)} {_SQL_COMPARISONS[type(node.ops[0])]} {visit(node.comparators[0])})"
+        raise ValueError(f"Could not compile expression: {expression}")
+
+    return visit(tree.body)
+
+def _sql_condition(condition: tuple) -> str:
+    """SQL for one condition of a `case` definition; see `_case_condition`."""
+    op, *args = condition
+
+    if op == 'eq':
+        column, value = args
+        if isinstance(value, str):
+            return f"{_sql_text(column)} = {_sql_literal(value)}"
+        return f"{_sql_name(column)} = {_sql_literal(value)}"
+
+    if op == 'in':
+        column, values = args
+        options = ", ".join(_sql_literal(value) for value in values)
+        if all(isinstance(value, str) for value in values):
+            return f"{_sql_text(column)} IN ({options})"
+        return f"{_sql_name(column)} IN ({options})"
+
+    if op == 'isna':
+        return f"{_sql_name(args[0])} IS NULL"
+
+    if op == 'notna':
+        return f"{_sql_name(args[0])} IS NOT NULL"
+
+    if op == 'eq_col':
+        return f"{_sql_text(args[0])} = {_sql_text(args[1])}"
+
+    if op == 'prefix':
+        column, prefixes = args
+        return _sql_prefixes(_sql_text(column), prefixes)
+
+    if op in ('concat_eq', 'concat_in'):
+        columns, target = args[0], args[1]
+        na_rep = args[2] if len(args) > 2 else None
+        text = " || ".join(_sql_text(column, na_rep) for column in columns)
+        targets = [target] if op == 'concat_eq' else list(target)
+        return f"({text}) IN ({', '.join(_sql_literal(value) for value in targets)})"
+
+    raise ValueError(f"Unsupported condition: {condition}")
+
+def _sql_prefixes(text: str, prefixes) -> str:
+    prefixes = (prefixes,) if isinstance(prefixes, str) else tuple(prefixes)
+    if not prefixes:
+        return "0"
+    return "(" + " OR ".join(f"substr({text}, 1, {len(prefix)}) = {_sql_literal(prefix)}" for prefix in prefixes) + ")"
+
+def _sql_value(value, columns: List[str]) -> str:
+    """SQL for the result of a `case` branch; see `_case_value`."""
+    if not isinstance(value, dict):
+        return _sql_literal(value)
+
+    if 'concat' in value:
+        return "(" + " || ".join(_sql_text(column, value.get('na_rep')) for column in value['concat']) + ")"
+
+    if 'expr' in value:
+        return _sql_expression(value['expr'], columns)
+
+    if 'column' in value:
+        if 'substr' in value:
+            return f"substr({_sql_text(value['column'])}, 1, {int(value['substr'])})"
+        if 'fillna' in value:
+            return f"COALESCE({_sql_name(value['column'])}, {_sql_literal(value['fillna'])})"
+        return _sql_name(value['column'])
+
+    raise ValueError(f"Unsupported case value: {value}")
+
+def _sql_case(definition: Dict, columns: List[str]) -> str:
+    """SQL CASE expression for a `case` definition."""
+    default = _sql_value(definition.get('default'), columns)
+    if not definition['case']:
+        return default
+
+    branches = []
+    for when, then in definition['case']:
+        condition = " AND ".join(f"({_sql_condition(c)})" for c in when) or "1"
+        branches.append(f"WHEN {condition} THEN {_sql_value(then, columns)}")
+    return f"CASE {' '.join(branches)} ELSE {default} END"
+
+def _sql_prefix_rules(definition: Dict) -> str:
+    """SQL CASE expression for a prefix rule table; see `_evaluate_prefix_rules`."""
+    text = _sql_text(definition.get('column'))
+    branches = []
+    for rule in definition['prefix_rules']:
+        if 'label' not in rule:
+            raise ValueError(f"Prefix rule without 'label': {rule}")
+
+        tests = []
+        if 'prefixes' in rule:
+            tests.append(_sql_prefixes(text, rule['prefixes']))
+        if 'first_chars' in rule:
+            tests.append(f"substr({text}, 1, 1) IN ({', '.join(_sql_literal(c) for c in rule['first_chars'])})")
+        for where_col, where_value in rule.get('where', {}).items():
+            tests.append(f"{_sql_text(where_col)} = {_sql_literal(str(where_value))}")
+
+        branches.append(f"WHEN {' AND '.join(tests) or '1'} THEN {_sql_literal(rule['label'])}")
+
+    default = _sql_literal(definition.get('default'))
+    return f"CASE {' '.join(branches)} ELSE {default} END" if branches else default
+
+def _compile_add_columns(table_name: str, columns: List[str], steps: List[Dict],
+                         source_columns: Dict[str, List[str]], drop_columns: List[str] = ()) -> str:
+    """Compile a sequence of `AddColumns` definitions into one SELECT over `table_name`.
+
+    Every definition becomes a layer of a WITH chain that sees the columns of the layer
+    before it, in the same order `AddColumns` evaluates them: within a step, expressions
+    and conditionals first, then the joins grouped by source table. A join is a LEFT JOIN
+    against the first row of each key, like `_LookupIndex`.
+
+    SQLite inlines single-use CTEs, which copies a column's expression into every place
+    that reads it. Layers whose columns are read three or more times further down are
+    materialized so long chains stay close to linear; lookup tables always are. The
+    MATERIALIZED hint needs SQLite 3.35+, older versions get plain CTEs.
+    """
+    materialized = "MATERIALIZED " if sqlite3.sqlite_version_info >= (3, 35, 0) else ""
+    layers, lookup_tables = [], []
+    columns = list(columns)
+    defined_in, reads = {}, []
+
+    def add_layer(new_columns: Dict[str, str], joins: str = ""):
+        used = " ".join(new_columns.values()) + joins
+        for col in columns:
+            if col in defined_in:
+                reads[defined_in[col]] += used.count(_sql_name(col))
+
+        source = f"_capa{len(layers) - 1}" if layers else _sql_name(table_name)
+        select = [f"{new_columns[col]} AS {_sql_name(col)}" if col in new_columns else f"t.{_sql_name(col)}"
+                  for col in columns]
+        select += [f"{sql} AS {_sql_name(col)}" for col, sql in new_columns.items() if col not in columns]
+        columns.extend(col for col in new_columns if col not in columns)
+        defined_in.update((col, len(layers)) for col in new_columns)
+        reads.append(0)
+        layers.append(f"(SELECT {', '.join(select)} FROM {source} AS t{joins})")
+
+    def check(column: str):
+        if column not in columns:
+            raise ValueError(f"Column '{column}' does not exist when it is used")
+
+    for definitions in steps:
+        merge_tasks = {}
+        for new_col, definition in definitions.items():
+            if isinstance(definition, str):
+                add_layer({new_col: _sql_expression(definition, columns)})
+
+            elif isinstance(definition, dict) and 'prefix_rules' in definition:
+                check(definition.get('column'))
+                add_layer({new_col: _sql_prefix_rules(definition)})
+
+            elif isinstance(definition, dict) and 'case' in definition:
+                add_layer({new_col: _sql_case(definition, columns)})
+
+            elif isinstance(definition, dict):
+                source_table = definition.get('source_table')
+                if not source_table:
+                    raise ValueError("Missing 'source_table' in column definition")
+                join_on = definition.get('join_on')
+                key = (join_on, definition.get('join_target', join_on), definition.get('normalize'))
+                merge_tasks.setdefault(source_table, {}).setdefault(key, []).append(
+                    (new_col, definition.get('source_column', new_col)))
+
+            else:
+                raise ValueError(f"Definition of column '{new_col}' cannot be compiled to SQL")
+
+        for source_table, lookups in merge_tasks.items():
+            for (join_on, join_target, normalize), fetches in lookups.items():
+                for column in [join_on] + [source_col for _, source_col in fetches]:
+                    if column not in source_columns[source_table]:
+                        raise ValueError(f"Column '{column}' not in source table '{source_table}'")
+                check(join_target)
+
+                key = _sql_name(join_on)
+                if normalize == 'strip':
+                    key = f"TRIM({_sql_text(join_on)}, ' ' || char(9, 10, 13))"
+                elif normalize is not None:
+                    raise ValueError(f"Unsupported key normalization: {normalize}")
+
+                table = _sql_name(source_table)
+                values = ", ".join(f"{_sql_name(source_col)} AS _v{i}" for i, (_, source_col) in enumerate(fetches))
+                lookup_tables.append(f"_busqueda{len(lookup_tables)} AS {materialized}(SELECT {key} AS _k, {values} FROM {table} "
+                               f"WHERE rowid IN (SELECT MIN(rowid) FROM {table} GROUP BY {key}))")
+                joins = f" LEFT JOIN _busqueda{len(lookup_tables) - 1} AS j ON j._k IS t.{_sql_name(join_target)}"
+                add_layer({new_col: f"j._v{i}" for i, (new_col, _) in enumerate(fetches)}, joins)
+
+    last = f"_capa{len(layers) - 1}" if layers else _sql_name(table_name)
+    select = ", ".join(_sql_name(col) for col in columns if col not in drop_columns)
+    if not layers:
+        return f"SELECT {select} FROM {last}"
+
+    ctes = lookup_tables + [f"_capa{i} AS {materialized if reads[i] > 2 else ''}{layer}" for i, layer in enumerate(layers)]
+    return f"WITH {', '.join(ctes)} SELECT {select} FROM {last}"
+
+def _expression_columns(expression: str) -> List[str]:
+    """Names (plain or `quoted`) an `eval` expression refers to."""
+    quoted = {}
+
+    def placeholder(match):
+        name = f"__column_{len(quoted)}"
+        quoted[name] = match.group(1)
+        return name
+
+    try:
+        tree = ast.parse(re.sub(r'`([^`]*)`', placeholder, expression), mode='eval')
+    except SyntaxError:
+        raise ValueError(f"Could not parse expression: {expression}")
+    return [quoted.get(node.id, node.id) for node in ast.walk(tree) if isinstance(node, ast.Name)]
+
+def _value_columns(value) -> List[str]:
+    if not isinstance(value, dict):
+        return []
+    if 'concat' in value:
+        return list(value['concat'])
+    if 'expr' in value:
+        return _expression_columns(value['expr'])
+    return [value['column']] if 'column' in value else []
+
+def _definition_reads(definition) -> Optional[List[str]]:
+    """Columns of `df` one `AddColumns` definition reads, or None when it cannot be known."""
+    if isinstance(definition, str):
+        return _expression_columns(definition)
+    if callable(definition):
+        return None
+    if 'prefix_rules' in definition:
+        return [definition.get('column')] + [col for rule in definition['prefix_rules'] for col in rule.get('where', {})]
+    if 'case' in definition:
+        reads = _value_columns(definition.get('default'))
+        for when, then in definition['case']:
+            for op, *args in when:
+                if op in ('concat_eq', 'concat_in'):
+                    reads.extend(args[0])
+                else:
+                    reads.extend(args[:2] if op == 'eq_col' else args[:1])
+            reads.extend(_value_columns(then))
+        return reads
+    return [definition.get('join_target', definition.get('join_on'))]
+
+def step_columns(steps: List[Dict]) -> tuple:
+    """Columns a sequence of `AddColumns` definitions reads from its input and writes.
+
+    Columns a step writes before reading them are not inputs. Within each dictionary
+    lookups are taken last, the order `AddColumns` evaluates them in.
+
+    Returns:
+        (reads, writes); reads is None when a definition is a function
+    """
+    reads, writes = [], []
+    for definitions in steps:
+        ordered = sorted(definitions.items(), key=lambda item: isinstance(item[1], dict)
+                         and not {'case', 'prefix_rules'} & set(item[1]))
+        for new_col, definition in ordered:
+            columns = _definition_reads(definition)
+            if columns is None:
+                reads = None
+            elif reads is not None:
+                reads.extend(col for col in columns if col not in writes and col not in reads)
+            if new_col not in writes:
+                writes.append(new_col)
+    return reads, writes
+
+def _steps_conflict(earlier: Dict, later: Dict) -> bool:
+    """Whether `later` has to wait for `earlier`: it reads what `earlier` writes, or overwrites what it uses."""
+    if earlier['reads'] is None or later['reads'] is None:
+        return True
+    return bool(set(later['reads']) & set(earlier['writes'])
+                or set(later['writes']) & (set(earlier['reads']) | set(earlier['writes'])))
+
+def _excel_rows_openpyxl(excel_path: str, sheet_name: Optional[str]):
+    """Stream the rows of a sheet with openpyxl in read-only mode."""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name is not None else workbook.worksheets[0]
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def _excel_rows_calamine(excel_path: str, sheet_name: Optional[str]):
+    """Stream the rows of a sheet with the Rust calamine reader (python-calamine)."""
+    try:
+        from python_calamine import CalamineWorkbook
+    except ImportError:
+        raise ImportError("The 'calamine' engine requires the python-calamine package")
+
+    workbook = CalamineWorkbook.from_path(excel_path)
+    sheet = workbook.get_sheet_by_name(sheet_name) if sheet_name is not None else workbook.get_sheet_by_index(0)
+    yield from (sheet.iter_rows() if hasattr(sheet, 'iter_rows') else sheet.to_python())
+
+# Streaming reader backends for ImportFromExcel: name -> function(excel_path, sheet_name) yielding row tuples
+EXCEL_ROW_READERS = {
+    'openpyxl': _excel_rows_openpyxl,
+    'calamine': _excel_rows_calamine,
+}
+
+def _excel_header(row: tuple) -> List[str]:
+    """Column names from a header row, named and de-duplicated the way `read_excel` does."""
+    names, seen = [], {}
+    for i, value in enumerate(row):
+        name = f"Unnamed: {i}" if value is None or value == "" else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def _iter_excel_batches(excel_path: str, sheet_name: Optional[str], engine: str, batch_size: int):
+    """Yield a sheet as DataFrames of at most `batch_size` rows. Blank rows are skipped."""
+    if engine not in EXCEL_ROW_READERS:
+        raise ValueError(f"Unknown Excel engine '{engine}', expected one of {sorted(EXCEL_ROW_READERS)}")
+
+    rows = EXCEL_ROW_READERS[engine](excel_path, sheet_name)
+    header = _excel_header(next(rows, ()))
+    width = len(header)
+
+    batch, yielded = [], False
+    for row in rows:
+        if all(value is None or value == "" for value in row):
+            continue
+        row = tuple(row[:width]) + (None,) * (width - len(row))
+        batch.append(tuple(None if value == "" else value for value in row))
+        if len(batch) >= batch_size:
+            yield pd.DataFrame.from_records(batch, columns=header)
+            batch, yielded = [], True
+
+    if batch or not yielded:
+        yield pd.DataFrame.from_records(batch, columns=header)
+
+# Column types of an ingestion schema and the SQLite type each one is stored as.
+# 'key' is text normalized for joins: surrounding blanks are stripped and integral
+# numbers lose the decimals Excel gives them (20.0 -> '20').
+SCHEMA_TYPES = {'key': 'TEXT', 'text': 'TEXT', 'integer': 'INTEGER', 'real': 'REAL'}
+
+def _parse_schema(schema: Dict[str, str]) -> List[tuple]:
+    """(column, type, optional) for each column of a schema. A trailing '?' marks an optional column."""
+    parsed = []
+    for column, kind in schema.items():
+        optional = kind.endswith('?')
+        kind = kind.rstrip('?')
+        if kind not in SCHEMA_TYPES:
+            raise ValueError(f"Unknown type '{kind}' for column '{column}', expected one of {sorted(SCHEMA_TYPES)}")
+        parsed.append((column, kind, optional))
+    return parsed
+
+def _key_label(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+def _apply_schema(df: pd.DataFrame, schema: Dict[str, str]) -> pd.DataFrame:
+    """Keep only the columns of `schema`, in its order, converted to their declared types.
+
+    Text columns are converted once per distinct value. Missing cells stay missing,
+    optional columns absent from `df` are filled with them.
+    """
+    parsed = _parse_schema(schema)
+    missing = [column for column, _, optional in parsed if column not in df.columns and not optional]
+    if missing:
+        raise ValueError(f"Columns {missing} of the schema are missing, found {list(df.columns)}")
+
+    columns = {}
+    for column, kind, _ in parsed:
+        values = df[column] if column in df.columns else pd.Series(None, index=df.index, dtype=object)
+        if kind in ('key', 'text'):
+            codes, uniques = pd.factorize(values)
+            convert = _key_label if kind == 'key' else str
+            labels = np.array([convert(value) for value in uniques] + [None], dtype=object)
+            columns[column] = pd.Series(labels[codes], index=df.index)
+            continue
+
+        try:
+            numbers = pd.to_numeric(values).astype(float)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Column '{column}' is declared '{kind}': {e}")
+        if kind == 'integer' and numbers.notna().all() and (numbers % 1 == 0).all():
+            numbers = numbers.astype(np.int64)
+        columns[column] = numbers
+    return pd.DataFrame(columns, index=df.index)
+
+def _infer_schema(batches) -> Dict[str, str]:
+    """Schema that fits the values of every batch, for data read without one.
+
+    A column is 'integer' when all its values are integral numbers, 'real' when they
+    are numbers and 'text' otherwise. Columns with no values at all are 'text'.
+    """
+    kinds = {}
+    for batch in batches:
+        for column in batch.columns:
+            kinds.setdefault(column, None)
+            values = batch[column].dropna()
+            if kinds[column] == 'text' or values.empty:
+                continue
+
+            inferred = pd.api.types.infer_dtype(values, skipna=True)
+            if inferred not in ('integer', 'floating', 'mixed-integer-float', 'boolean'):
+                kinds[column] = 'text'
+            elif kinds[column] != 'real' and (values.astype(float) % 1 == 0).all():
+                kinds[column] = 'integer'
+            else:
+                kinds[column] = 'real'
+    return {column: kind or 'text' for column, kind in kinds.items()}
+
+def _untyped_table_sql(table_name: str, columns) -> str:
+    """CREATE TABLE statement whose columns have no declared type, so each value keeps its own."""
+    return f"CREATE TABLE {_sql_name(table_name)} ({', '.join(_sql_name(column) for column in columns)})"
+
+def _schema_table_sql(table_name: str, schema: Dict[str, str]) -> str:
+    """CREATE TABLE statement for a schema, STRICT when SQLite supports it (3.37+)."""
+    columns = ", ".join(f"{_sql_name(column)} {SCHEMA_TYPES[kind]}" for column, kind, _ in _parse_schema(schema))
+    strict = " STRICT" if sqlite3.sqlite_version_info >= (3, 37, 0) else ""
+    return f"CREATE TABLE {_sql_name(table_name)} ({columns}){strict}"
+
+def _read_options(schema: Optional[Dict[str, str]]) -> Dict:
+    """`pd.read_excel` options that read only the columns of `schema`.
+
+    Text columns are read as the raw cell values, so codes are not turned into floats
+    (a '0601' cell stays '0601').
+    """
+    if schema is None:
+        return {}
+    return {
+        'usecols': lambda column: column in schema,
+        'dtype': {column: object for column, kind, _ in _parse_schema(schema) if SCHEMA_TYPES[kind] == 'TEXT'},
+    }
+
+def _read_excel(excel_path: str, sheet_name: Optional[str], engine: Optional[str] = None,
+                schema: Dict[str, str] = None) -> pd.DataFrame:
+    """Whole sheet as one DataFrame, with `pd.read_excel` or one of the streaming readers.
+
+    With a `schema` only its columns are read, converted with `_apply_schema`.
+    """
+    if engine in (None, 'pandas'):
+        df = pd.read_excel(excel_path, sheet_name=sheet_name if sheet_name is not None else 0, **_read_options(schema))
+    else:
+        df = pd.concat(_iter_excel_batches(excel_path, sheet_name, engine, 100000), ignore_index=True)
+    return _apply_schema(df, schema) if schema is not None else df
+
+def _read_excel_job(excel_path: str, sheet_name: str, engine: Optional[str] = None,
+                    schema: Dict[str, str] = None) -> pd.DataFrame:
+    """Parse one worksheet. Runs inside the worker processes of `ImportManyFromExcel`."""
+    return _read_excel(excel_path, sheet_name, engine, schema)
+
+def _sql_values(column: pd.Series) -> list:
+    """Python values of a column as sqlite3 expects them, with None for missing cells."""
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return [None if pd.isna(value) else value.isoformat(" ") for value in column]
+    values = column.astype(object)
+    return values.where(column.notna(), None).tolist()
+
+# Rows of an Excel worksheet, header included
+EXCEL_MAX_ROWS = 1048576
+
+def _frame_row_batches(df: pd.DataFrame, batch_size: int):
+    """Yield the rows of `df` as lists of tuples of Python values, with None for missing cells."""
+    for start in range(0, len(df), batch_size):
+        chunk = df.iloc[start:start + batch_size]
+        columns = [chunk[col].astype(object).where(chunk[col].notna(), None).tolist() for col in chunk.columns]
+        yield list(zip(*columns))
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _snapshot_frame(df: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """The frame `pd.read_sql` would return after writing `df` with `to_sql`, or None.
+
+    None means a column would not come back with the same values and dtype (dates,
+    categoricals, mixed objects...), in which case the snapshot is taken from SQLite later.
+    """
+    columns = {}
+    for name, column in df.items():
+        if pd.api.types.is_bool_dtype(column):
+            columns[name] = column.astype(np.int64)
+        elif column.dtype.kind in 'if':
+            columns[name] = column
+        elif column.dtype == object and pd.api.types.infer_dtype(column, skipna=True) in ('string', 'empty'):
+            columns[name] = column.where(column.notna(), None)
+        elif column.dtype != object and pd.api.types.is_string_dtype(column):
+            columns[name] = column
+        else:
+            return None
+    return pd.DataFrame(columns).reset_index(drop=True)
+
+def _compact_frame(df: pd.DataFrame, categorical: List[str] = (), max_unique_ratio: float = 0.5):
+    """Return `df` with memory-compact dtypes and the columns it made categorical.
+
+    Text columns with few distinct values (or listed in `categorical`) become categoricals.
+    Numeric columns keep their 64-bit dtypes: a narrower one chosen from the current values
+    could overflow or round in later arithmetic (sums, products of measures).
+    """
+    columns, chosen = {}, []
+    for name, column in df.items():
+        text = column.dtype == object or pd.api.types.is_string_dtype(column.dtype)
+        if text and (name in categorical or (len(column) and column.nunique() <= max_unique_ratio * len(column))):
+            columns[name] = column.astype('category')
+            chosen.append(name)
+        else:
+            columns[name] = column
+    return pd.DataFrame(columns, index=df.index), chosen
+
+def _write_snapshot(df: pd.DataFrame, path: str, file_format: str):
+    """Write a snapshot atomically, so readers never see a half-written file."""
+    temporary = f"{path}.tmp"
+    if file_format == 'parquet':
+        df.to_parquet(temporary, index=False)
+    else:
+        df.to_feather(temporary)
+    os.replace(temporary, path)
+
+def _read_snapshot(path: str, file_format: str) -> pd.DataFrame:
+    """Read a snapshot through a memory map, so pages are loaded by the OS on demand."""
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_table(path, memory_map=True).to_pandas()
+    from pyarrow import feather
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+def _peak_rss() -> Optional[int]:
+    """Peak resident memory of the process in bytes, or None where it cannot be read."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    return getattr(info, 'peak_wset', info.rss)
+
+def _frame_stats(value) -> tuple:
+    """(rows, bytes) of a DataFrame, a list or dict of them, or a row count; (None, None) otherwise.
+
+    Bytes are the shallow in-memory size, so text columns count one pointer per cell.
+    """
+    if isinstance(value, pd.DataFrame):
+        return len(value), int(value.memory_usage(index=False).sum())
+    if isinstance(value, (list, dict)) and value:
+        frames = list(value.values()) if isinstance(value, dict) else value
+        if all(isinstance(frame, pd.DataFrame) for frame in frames):
+            stats = [_frame_stats(frame) for frame in frames]
+            return sum(rows for rows, _ in stats), sum(size for _, size in stats)
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        return int(value), None
+    return None, None
+
+def _writes(method):
+    """Run a TableProcessor method as the only user of the writer connection (see `_writing`)."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._writing():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def _instrumented(method):
+    """Record the calls of a TableProcessor method in the active `PerfRun`."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._perf is None:
+            return method(self, *args, **kwargs)
+        return self._measure('call', method.__name__, method, self, *args, **kwargs)
+    return wrapper
+
+#-------------------------------------------------------------------
 class TableProcessor:
 
+    MANIFEST_TABLE = '_ingestion_manifest'
+    PARTITION_STATE_TABLE = '_partition_state'
+    TABLE_VERSIONS_TABLE = '_table_versions'
+    DTYPE_HINTS_TABLE = '_dtype_hints'
+    PERF_LOG_TABLE = '_perf_log'
+    MERGE_DIAGNOSTICS_TABLE = '_merge_diagnostics'
+
+    # Unmatched or duplicated keys kept per join in the merge diagnostics, those with most rows
+    DIAGNOSTICS_TOP_KEYS = 20
+
+    # Settings of the writer connection in concurrent mode
+    CONCURRENT_PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL'}
+
+    # Settings applied during BulkLoad; the previous values are restored afterwards
+    BULK_PRAGMAS = {'journal_mode': 'MEMORY', 'synchronous': 'OFF', 'cache_size': -256 * 1024, 'temp_store': 'MEMORY'}
+
     #-------------------------------------------------------------------
-    def __init__(self, db_path: str = 'database.db'):
+    def __init__(self, db_path: str = 'database.db', cache_max_bytes: int = 256 * 1024 ** 2,
+                 index_spec: Dict[str, List[Union[str, List[str]]]] = None,
+                 snapshots: List[str] = None, snapshot_format: str = 'feather',
+                 compact_dtypes: bool = False, schemas: Dict[str, Dict[str, str]] = None,
+                 concurrent: bool = False):
         """Initialize the TableProcessor with a database connection.
         Args:
             db_path: Path to the SQLite database file
+            cache_max_bytes: Memory budget of the in-process table cache (0 disables it)
+            index_spec: Indexes to keep on each table, as {table: [column or [columns], ...]}.
+                They are (re)created after every write to the table, followed by ANALYZE
+            snapshots: Tables to keep a columnar snapshot of next to the database file,
+                used by `GetTables` while it matches the table's version (needs pyarrow)
+            snapshot_format: 'feather' or 'parquet'
+            compact_dtypes: Load tables with categorical text columns. Columns once made
+                categorical stay so on later loads of the same table
+            schemas: Ingestion schema of each table, {table_name: {column: type}} with the
+                types of `SCHEMA_TYPES`. The Import* methods read only those columns,
+                convert them and create the table with the declared types
+            concurrent: Let several threads use the processor at once. The database is put
+                in WAL mode, writes go one at a time through `conn`, and reads (`GetTables`,
+                `execute_sql`, `table_exists`...) use a read-only connection of the calling
+                thread, so they run while another thread writes and see the last commit
         """
+        if concurrent and db_path == ':memory:':
+            raise ValueError("concurrent mode needs a database file, not ':memory:'")
         self.db_path = db_path
         self.conn = None
+        self.concurrent = concurrent
+        self._readers = threading.local()
+        self._reader_conns = []
+        self._idle_readers = []
+        self.index_spec = index_spec or {}
+        self.compact_dtypes = compact_dtypes
+        self.schemas = schemas or {}
+        for schema in self.schemas.values():
+            _parse_schema(schema)
+        self._memory = {}
+
+        if snapshot_format not in ('feather', 'parquet'):
+            raise ValueError(f"Unsupported snapshot format: {snapshot_format}")
+        self.snapshot_format = snapshot_format
+        self.snapshots = set(snapshots or [])
+        if self.snapshots:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                print("pyarrow is not installed, table snapshots are disabled")
+                self.snapshots = set()
+
+        self.cache_max_bytes = cache_max_bytes
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._cache_evictions = 0
+        self._data_version = None
+        self._in_transaction = False
+        self._pending_snapshots = {}
+        self._bulk = None
+        # `_lock` guards the writer connection, held by `_writing` for a whole write.
+        # `_cache_lock` guards the table cache and is only held for short updates.
+        # When both are needed `_lock` is taken first
+        self._lock = threading.RLock()
+        self._cache_lock = threading.RLock()
+        self._writer = None
+        self._generation = 0
+        self._versions = {}
+        self._dirty = set()
+        self._deferred = deque()
+        self._perf = None
+        self._session_id = None
         
     def __enter__(self):
         """Context manager entry - opens database connection."""
@@ -25,20 +1003,813 @@ class TableProcessor:
 
     def connect(self):
         """Establish a connection to the SQLite database."""
-        if self.conn is None:
-            self.conn = sqlite3.connect(self.db_path)
+        if self.conn is not None:
+            return
+        with self._lock:
+            if self.conn is None:
+                conn = sqlite3.connect(self.db_path, check_same_thread=False)
+                if self.concurrent:
+                    for name, value in self.CONCURRENT_PRAGMAS.items():
+                        conn.execute(f"PRAGMA {name} = {value}")
+                self.conn = conn
             
     def close(self):
         """Close the database connection if it exists."""
-        if self.conn is not None:
-            self.conn.close()
-            self.conn = None
+        with self._lock:
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns, self._idle_readers = [], []
+            self._readers = threading.local()
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+        self.ClearCache()
+
+    @contextmanager
+    def _writing(self, wait: bool = True):
+        """Hold the writer connection for the enclosed statements.
+
+        Writes of other threads wait until the block ends. Reads of the thread holding it
+        go through `conn`, so they see its uncommitted changes. With `wait=False` the
+        block gets None instead of waiting for another thread's write.
+        """
+        self.connect()
+        if not self._lock.acquire(blocking=wait):
+            yield None
+            return
+        owner, self._writer = self._writer, threading.get_ident()
+        try:
+            yield self.conn
+        finally:
+            self._writer = owner
+            if owner != threading.get_ident():
+                # Its writes are committed, the read connections see them from now on
+                with self._cache_lock:
+                    self._dirty.clear()
+            self._lock.release()
+        if owner != threading.get_ident():
+            self._flush_deferred()
+
+    def _write_soon(self, write: Callable[[], None]):
+        """Run a bookkeeping write now, or when the thread holding the writer connection
+        releases it, instead of waiting for it (that thread may be waiting for this one)."""
+        self._deferred.append(write)
+        self._flush_deferred()
+
+    def _flush_deferred(self):
+        while self._deferred:
+            with self._writing(wait=False) as writer:
+                if writer is None:
+                    return
+                while self._deferred:
+                    self._deferred.popleft()()
+
+    def _read_conn(self) -> sqlite3.Connection:
+        """Connection for a read from the calling thread.
+
+        In concurrent mode it is a read-only connection the thread takes from the pool on
+        its first read and gives back when it ends, except for the thread holding the
+        writer connection. Otherwise it is `conn`.
+        """
+        self.connect()
+        if not self.concurrent or self._writer == threading.get_ident():
+            return self.conn
+        lease = getattr(self._readers, 'lease', None)
+        if lease is None:
+            try:
+                conn = self._idle_readers.pop()
+            except IndexError:
+                uri = f"{Path(os.path.abspath(self.db_path)).as_uri()}?mode=ro"
+                conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+                self._reader_conns.append(conn)
+            lease = self._readers.lease = _ReadLease(conn)
+            weakref.finalize(lease, self._idle_readers.append, conn)
+        return lease.conn
+
+    @contextmanager
+    def _reading(self):
+        """Connection for a read that may load a table into the cache.
+
+        Outside concurrent mode the reads share `conn`, one thread at a time, and see the
+        uncommitted changes of the thread writing.
+        """
+        if self.concurrent:
+            yield self._read_conn()
+        else:
+            with self._cache_lock:
+                yield self.conn
+
+    def _cache_token(self, table_name: str) -> Optional[tuple]:
+        """What has to stay the same while a table is read for the copy to be cached.
+
+        None when it cannot be cached: in concurrent mode, the read connections do not see
+        the changes of the write in progress to the tables it has written.
+        """
+        if self.concurrent and table_name in self._dirty:
+            return None
+        return self._generation, self._versions.get(table_name, 0)
 
     def SetTable(self, table_name: str, df: pd.DataFrame):
+        self._write_table(table_name, df)
+
+    @_instrumented
+    @_writes
+    def _write_table(self, table_name: str, df: pd.DataFrame, if_exists: str = 'replace',
+                     schema: Dict[str, str] = None):
+        """Write a DataFrame to the database and drop any cached copy of the table.
+
+        With a `schema` the table is created with its declared column types.
+        """
+        self.connect()
+        if self._bulk is None and schema is not None:
+            with self._transaction():
+                self._insert_frame(table_name, df, if_exists=if_exists, schema=schema)
+        elif self._bulk is None:
+            if if_exists == 'append':
+                self._unwatch_table(table_name)
+            df.to_sql(table_name, self.conn, if_exists=if_exists, index=False)
+            self._invalidate(table_name)
+            self._table_written(table_name)
+        else:
+            # Inside BulkLoad each write stays atomic on its own through a savepoint
+            self.conn.execute("SAVEPOINT bulk_write")
+            try:
+                self._insert_frame(table_name, df, if_exists=if_exists, chunksize=self._bulk['chunksize'], schema=schema)
+            except Exception:
+                self.conn.execute("ROLLBACK TO bulk_write")
+                raise
+            finally:
+                self.conn.execute("RELEASE bulk_write")
+
+        if table_name in self.snapshots and if_exists == 'replace':
+            snapshot = _snapshot_frame(df)
+            if snapshot is not None:
+                self._store_snapshot(table_name, snapshot, self._version(table_name))
+
+    @contextmanager
+    def BulkLoad(self, chunksize: int = 100000):
+        """Context manager for loading large amounts of data quickly.
+
+        While it is active every write of this processor runs in one transaction with
+        load-friendly PRAGMAs (in-memory journal, no fsync, large page cache, temp
+        storage in memory) and goes through batched `executemany` inserts. Indexes of
+        the tables written are dropped on first write and rebuilt once at the end.
+        The previous settings are restored on exit, and the whole load is rolled back
+        if the block raises. Nested uses join the outer load.
+
+        Args:
+            chunksize: Rows per `executemany` batch
+
+        Yields:
+            Dictionary filled on exit with 'rows', 'seconds' and 'rows_per_second'
+        """
+        # Other threads wait for the whole load, whose writes are one transaction
+        with self._writing():
+            if self._bulk is not None:
+                yield self._bulk['stats']
+                return
+
+            if self.conn.in_transaction:
+                self.conn.commit()
+            previous = {name: self.conn.execute(f"PRAGMA {name}").fetchone()[0] for name in self.BULK_PRAGMAS}
+            for name, value in self.BULK_PRAGMAS.items():
+                if name == 'journal_mode' and str(previous[name]).lower() == 'wal':
+                    continue
+                self.conn.execute(f"PRAGMA {name} = {value}")
+
+            stats = {'rows': 0, 'seconds': 0.0, 'rows_per_second': 0.0}
+            self._bulk = {'chunksize': chunksize, 'indexes': {}, 'written': set(), 'stats': stats}
+            start = time.perf_counter()
+            try:
+                with self._transaction():
+                    yield stats
+                    self._rebuild_deferred_indexes()
+                    written, self._bulk['written'] = self._bulk['written'], set()
+                    for table_name in written:
+                        self.CreateIndexes(table_name)
+            finally:
+                self._bulk = None
+                for name, value in previous.items():
+                    self.conn.execute(f"PRAGMA {name} = {value}")
+
+            stats['seconds'] = time.perf_counter() - start
+            stats['rows_per_second'] = stats['rows'] / max(stats['seconds'], 1e-9)
+            print(f"Bulk load: {stats['rows']:,} rows in {stats['seconds']:.1f} s ({stats['rows_per_second']:,.0f} rows/s)")
+
+    def _defer_indexes(self, table_name: str):
+        """Drop the indexes of a table written during BulkLoad, remembering them for the end."""
+        if table_name in self._bulk['indexes']:
+            return
+        indexes = self.conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (table_name,)
+        ).fetchall()
+        for name, _ in indexes:
+            self.conn.execute(f'DROP INDEX "{name}"')
+        self._bulk['indexes'][table_name] = [sql for _, sql in indexes]
+
+    def _rebuild_deferred_indexes(self):
+        for table_name, statements in self._bulk['indexes'].items():
+            if not self.table_exists(table_name):
+                continue
+            for statement in statements:
+                try:
+                    self.conn.execute(statement)
+                except sqlite3.OperationalError as e:
+                    print(f"Index not rebuilt on '{table_name}': {e}")
+
+    @_writes
+    def CreateIndexes(self, table_name: str = None) -> List[str]:
+        """Create the indexes `index_spec` declares and refresh planner statistics.
+
+        Indexes on columns the table does not have (yet) are skipped.
+
+        Args:
+            table_name: Table to index (defaults to every table in `index_spec`)
+
+        Returns:
+            Names of the indexes created
+        """
         self.connect()
-        df.to_sql(table_name, self.conn, if_exists='replace', index=False)
+        tables = [table_name] if table_name is not None else list(self.index_spec)
+        created = []
+        for table in tables:
+            if table not in self.index_spec or not self.table_exists(table):
+                continue
+            existing = self.GetColumns(table)
+            indexed = {row[0] for row in self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?", (table,))}
+            for columns in self.index_spec[table]:
+                columns = [columns] if isinstance(columns, str) else list(columns)
+                if any(col not in existing for col in columns):
+                    continue
+                name = f"ix_{table}_{'_'.join(columns)}"
+                if name not in indexed:
+                    self.conn.execute(f"CREATE INDEX {_sql_name(name)} ON {_sql_name(table)} "
+                                      f"({', '.join(_sql_name(col) for col in columns)})")
+                    created.append(name)
+            self.conn.execute("PRAGMA analysis_limit = 1000")
+            self.conn.execute(f"ANALYZE {_sql_name(table)}")
+        if not self._in_transaction:
+            self.conn.commit()
+        return created
+
+    def _table_written(self, table_name: str):
+        """Index a table after a write, or at the end of the running BulkLoad."""
+        if table_name not in self.index_spec:
+            return
+        if self._bulk is not None:
+            self._bulk['written'].add(table_name)
+        else:
+            self.CreateIndexes(table_name)
+
+    @contextmanager
+    def _transaction(self):
+        """Run the enclosed statements, including DDL, as one transaction.
+
+        Nested uses join the outer transaction, which owns the commit. The writer
+        connection is held until the commit, and the snapshots of the tables written
+        are stored after it (or dropped on rollback).
+        """
+        with self._writing():
+            if self._in_transaction:
+                yield
+                return
+
+            if self.conn.in_transaction:
+                self.conn.commit()
+            self.conn.execute("BEGIN")
+            self._in_transaction = True
+            try:
+                yield
+            except Exception:
+                self.conn.rollback()
+                self._pending_snapshots.clear()
+                raise
+            else:
+                self.conn.commit()
+            finally:
+                self._in_transaction = False
+
+            # Snapshots of the tables written are only stored once their rows are committed
+            pending, self._pending_snapshots = self._pending_snapshots, {}
+            for table_name, (snapshot, version) in pending.items():
+                self._store_snapshot(table_name, snapshot, version)
+
+    def _insert_frame(self, table_name: str, df: pd.DataFrame, if_exists: str = 'replace',
+                      chunksize: int = 50000, schema: Dict[str, str] = None):
+        """Create (if needed) and fill a table with `executemany`, without committing.
+
+        Column types are the ones declared in `schema`, or else the ones `to_sql` would
+        create. Call it inside `_transaction()` to make several writes atomic.
+        """
+        if self._bulk is not None:
+            self._defer_indexes(table_name)
+
+        exists = self.table_exists(table_name)
+        if exists and if_exists == 'fail':
+            raise ValueError(f"Table '{table_name}' already exists.")
+        if exists and if_exists == 'append':
+            self._unwatch_table(table_name)
+        if exists and if_exists == 'replace':
+            self.conn.execute(f'DROP TABLE "{table_name}"')
+        if (not exists or if_exists == 'replace') and schema is not None:
+            self.conn.execute(_schema_table_sql(table_name, schema))
+        elif not exists or if_exists == 'replace':
+            self.conn.execute(pd.io.sql.get_schema(df, table_name, con=self.conn))
+
+        columns = ", ".join(f'"{col}"' for col in df.columns)
+        placeholders = ", ".join("?" for _ in df.columns)
+        statement = f'INSERT INTO "{table_name}" ({columns}) VALUES ({placeholders})'
+
+        for start in range(0, len(df), chunksize):
+            chunk = df.iloc[start:start + chunksize]
+            self.conn.executemany(statement, zip(*(_sql_values(chunk[col]) for col in chunk.columns)))
+
+        if self._bulk is not None:
+            self._bulk['stats']['rows'] += len(df)
+        self._invalidate(table_name)
+        self._table_written(table_name)
+
+    #-------------------------------------------------------------------
+    @contextmanager
+    def PerfRun(self, name: str, profile_dir: str = None, json_dir: str = None):
+        """Context manager that measures the processor calls and steps made inside it.
+
+        Every call of an instrumented method (GetTables, AddColumns, table writes, the
+        imports and exports...) and every `RunSteps` step is recorded with its wall and
+        CPU time, the growth of the process peak RSS, and the rows and bytes of the
+        DataFrames it received and returned. Nested calls are recorded too, with their
+        depth. CPU time is the whole process's, so steps running at the same time share it.
+
+        At the end the records are appended to the `_perf_log` table under a new run id,
+        which makes runs comparable over time (see `PerfReport`).
+
+        Args:
+            name: Name of the run, e.g. the pipeline being measured
+            profile_dir: Directory for a cProfile dump of the run (`<run_id>.prof`). Only
+                the calling thread is profiled
+            json_dir: Directory for a JSON copy of the records (`<run_id>.json`)
+
+        Yields:
+            The run id
+        """
+        if self._perf is not None:
+            yield self._perf['run_id']
+            return
+
+        self.connect()
+        run_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        started_at = datetime.now().isoformat(timespec='seconds')
+        self._perf = {'run_id': run_id, 'records': [], 'local': threading.local()}
+        profiler = cProfile.Profile() if profile_dir else None
+        rss, wall, cpu = _peak_rss(), time.perf_counter(), time.process_time()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            yield run_id
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            peak = _peak_rss()
+            records, self._perf = self._perf['records'], None
+            records.append({
+                'kind': 'run', 'name': name, 'depth': 0,
+                'wall_s': time.perf_counter() - wall, 'cpu_s': time.process_time() - cpu,
+                'rss_peak_delta': peak - rss if peak is not None else None,
+                'rows_in': None, 'rows_out': None, 'bytes_in': None, 'bytes_out': None,
+            })
+
+        if profiler is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(profile_dir, f"{run_id}.prof"))
+        self._save_perf(run_id, name, started_at, records, json_dir)
+
+    def _measure(self, kind: str, name: str, func: Callable, *args, **kwargs):
+        """Call `func` and, inside a `PerfRun`, record what the call cost."""
+        if self._perf is None:
+            return func(*args, **kwargs)
+
+        local = self._perf['local']
+        depth = getattr(local, 'depth', 0)
+        local.depth = depth + 1
+        rss, wall, cpu = _peak_rss(), time.perf_counter(), time.process_time()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            local.depth = depth
+
+        inputs = [value for value in list(args) + list(kwargs.values()) if isinstance(value, (pd.DataFrame, list, dict))]
+        rows_in, bytes_in = next((stats for stats in map(_frame_stats, inputs) if stats[0] is not None), (None, None))
+        rows_out, bytes_out = _frame_stats(result)
+        peak = _peak_rss()
+        self._perf['records'].append({
+            'kind': kind, 'name': name, 'depth': depth,
+            'wall_s': time.perf_counter() - wall, 'cpu_s': time.process_time() - cpu,
+            'rss_peak_delta': peak - rss if peak is not None else None,
+            'rows_in': rows_in, 'rows_out': rows_out, 'bytes_in': bytes_in, 'bytes_out': bytes_out,
+        })
+        return result
+
+    def _save_perf(self, run_id: str, name: str, started_at: str, records: List[Dict], json_dir: str = None):
+        fields = ['kind', 'name', 'depth', 'wall_s', 'cpu_s', 'rss_peak_delta', 'rows_in', 'rows_out', 'bytes_in', 'bytes_out']
+        with self._writing():
+            self.conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{self.PERF_LOG_TABLE}" ('
+                'run_id TEXT NOT NULL, run_name TEXT, started_at TEXT, kind TEXT, name TEXT, depth INTEGER, '
+                'wall_s REAL, cpu_s REAL, rss_peak_delta INTEGER, rows_in INTEGER, rows_out INTEGER, '
+                'bytes_in INTEGER, bytes_out INTEGER)'
+            )
+            self.conn.executemany(
+                f'INSERT INTO "{self.PERF_LOG_TABLE}" (run_id, run_name, started_at, {", ".join(fields)}) '
+                f'VALUES (?, ?, ?, {", ".join("?" for _ in fields)})',
+                [(run_id, name, started_at) + tuple(record[field] for field in fields) for record in records]
+            )
+            if not self._in_transaction:
+                self.conn.commit()
+
+        if json_dir:
+            os.makedirs(json_dir, exist_ok=True)
+            with open(os.path.join(json_dir, f"{run_id}.json"), "w", encoding="utf-8") as file:
+                json.dump({'run_id': run_id, 'name': name, 'started_at': started_at, 'records': records}, file, indent=1)
+
+    def PerfReport(self, run_id: str = None) -> pd.DataFrame:
+        """Summary of a `PerfRun` by call or step, slowest first.
+
+        Args:
+            run_id: Run to summarize (defaults to the last one recorded)
+
+        Returns:
+            DataFrame with one row per (kind, name): calls, total wall and CPU seconds,
+            largest peak RSS growth and the rows and bytes in and out
+        """
+        conn = self._read_conn()
+        if not self.table_exists(self.PERF_LOG_TABLE):
+            raise ValueError("No runs have been recorded")
+        if run_id is None:
+            run_id = conn.execute(f'SELECT run_id FROM "{self.PERF_LOG_TABLE}" ORDER BY rowid DESC LIMIT 1').fetchone()[0]
+        return pd.read_sql(
+            f'SELECT run_id, run_name, kind, name, MIN(depth) AS depth, COUNT(*) AS calls, SUM(wall_s) AS wall_s, '
+            f'SUM(cpu_s) AS cpu_s, MAX(rss_peak_delta) AS rss_peak_delta, SUM(rows_in) AS rows_in, '
+            f'SUM(rows_out) AS rows_out, SUM(bytes_in) AS bytes_in, SUM(bytes_out) AS bytes_out '
+            f'FROM "{self.PERF_LOG_TABLE}" WHERE run_id = ? GROUP BY run_id, run_name, kind, name ORDER BY wall_s DESC',
+            conn, params=(run_id,)
+        )
+
+    def _run_id(self) -> str:
+        """Id of the active `PerfRun`, or else of this processor's session."""
+        if self._perf is not None:
+            return self._perf['run_id']
+        if self._session_id is None:
+            self._session_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        return self._session_id
+
+    def _record_merge_diagnostics(self, diagnostics: List[tuple]):
+        """Store the key counts of joins that missed or met duplicated keys.
+
+        Each join gets a summary row (rank 0, total rows and distinct keys) and its
+        `DIAGNOSTICS_TOP_KEYS` keys with most rows (rank 1, 2...). A step of `RunSteps`
+        inside `BulkLoad` stores them once the load ends.
+        """
+        run_id, recorded_at = self._run_id(), datetime.now().isoformat(timespec='seconds')
+        rows, lines = [], []
+        for table_name, target_columns, source_table, join_target, join_on, kind, counts in diagnostics:
+            join = (run_id, recorded_at, table_name, target_columns, source_table, join_target, join_on, kind)
+            rows.append(join + (0, None, int(counts.sum()), len(counts)))
+            top = counts.head(self.DIAGNOSTICS_TOP_KEYS)
+            rows.extend(join + (rank, None if pd.isna(key) else str(key), int(count), None)
+                        for rank, (key, count) in enumerate(top.items(), start=1))
+            if kind == 'unmatched':
+                lines.append(f"[Advertencia] {table_name}.{target_columns}: {int(counts.sum())} filas no coincidentes "
+                             f"({len(counts)} claves) al unir '{join_target}' -> '{join_on}' desde '{source_table}'")
+            else:
+                lines.append(f"[Advertencia] {len(counts)} claves duplicadas con valores distintos en '{join_on}' "
+                             f"de '{source_table}', se usa la primera fila")
+
+        def store():
+            self.conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{self.MERGE_DIAGNOSTICS_TABLE}" ('
+                'run_id TEXT NOT NULL, recorded_at TEXT, table_name TEXT, target_columns TEXT, source_table TEXT, '
+                'join_target TEXT, join_on TEXT, kind TEXT, key_rank INTEGER, key_value TEXT, row_count INTEGER, '
+                'distinct_keys INTEGER)'
+            )
+            self.conn.executemany(
+                f'INSERT INTO "{self.MERGE_DIAGNOSTICS_TABLE}" VALUES ({", ".join("?" for _ in range(12))})', rows
+            )
+            if not self._in_transaction:
+                self.conn.commit()
+
+            with open("merge_warnings.txt", "a", encoding="utf-8") as log_file:
+                log_file.write("".join(f"{run_id} {line} (ver {self.MERGE_DIAGNOSTICS_TABLE})\n" for line in lines))
+
+        self._write_soon(store)
+
+    def RunId(self) -> str:
+        """Id under which the current calls record their diagnostics: the active `PerfRun`'s,
+        or else this processor's session's."""
+        return self._run_id()
+
+    def MergeDiagnostics(self, run_id: str = None, detail: bool = False) -> pd.DataFrame:
+        """Unmatched and duplicated join keys recorded by `AddColumns` during a run.
+
+        Args:
+            run_id: Run to report (defaults to the current one, see `RunId`). Empty when
+                the run recorded nothing
+            detail: Return the recorded keys with their row counts instead of one row per join
+
+        Returns:
+            DataFrame ordered by rows affected. Totals are summed over every call of the
+            run, so a table processed in blocks reports the whole table
+        """
+        conn = self._read_conn()
+        if not self.table_exists(self.MERGE_DIAGNOSTICS_TABLE):
+            return pd.DataFrame()
+        if run_id is None:
+            run_id = self._run_id()
+
+        join = "table_name, target_columns, source_table, join_target, join_on, kind"
+        if detail:
+            query = (f'SELECT run_id, {join}, key_value, SUM(row_count) AS rows FROM "{self.MERGE_DIAGNOSTICS_TABLE}" '
+                     f'WHERE run_id = ? AND key_rank > 0 GROUP BY run_id, {join}, key_value ORDER BY rows DESC')
+        else:
+            query = (f'SELECT run_id, {join}, SUM(row_count) AS rows, MAX(distinct_keys) AS distinct_keys '
+                     f'FROM "{self.MERGE_DIAGNOSTICS_TABLE}" WHERE run_id = ? AND key_rank = 0 '
+                     f'GROUP BY run_id, {join} ORDER BY rows DESC')
+        return pd.read_sql(query, conn, params=(run_id,))
+
+    #-------------------------------------------------------------------
+    def CacheStats(self) -> Dict[str, int]:
+        """Counters of the in-process table cache.
+
+        Returns:
+            Dictionary with hits, misses, evictions, cached entries and cached bytes
+        """
+        return {
+            'hits': self._cache_hits,
+            'misses': self._cache_misses,
+            'evictions': self._cache_evictions,
+            'entries': len(self._cache),
+            'bytes': self._cache_bytes,
+        }
+
+    def ClearCache(self):
+        """Drop every cached table and join index."""
+        with self._cache_lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+            self._generation += 1
+
+    def _invalidate(self, table_name: str):
+        with self._cache_lock:
+            entry = self._cache.pop(table_name, None)
+            if entry is not None:
+                self._cache_bytes -= entry['nbytes']
+            self._versions[table_name] = self._versions.get(table_name, 0) + 1
+            self._dirty.add(table_name)
+        self._pending_snapshots.pop(table_name, None)
+        if table_name in self.snapshots:
+            self._bump_version(table_name)
+
+    #-------------------------------------------------------------------
+    def _snapshot_path(self, table_name: str) -> str:
+        directory = f"{os.path.splitext(self.db_path)[0]}_snapshots"
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{table_name}.{self.snapshot_format}")
+
+    def _ensure_table_versions(self):
+        self.conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{self.TABLE_VERSIONS_TABLE}" ('
+            'table_name TEXT PRIMARY KEY, version INTEGER NOT NULL, '
+            'snapshot_version INTEGER, updated_at TEXT)'
+        )
+
+    @_writes
+    def _bump_version(self, table_name: str) -> int:
+        """Record that a table changed, which makes its snapshot stale. Returns the new version."""
+        self._ensure_table_versions()
+        self.conn.execute(
+            f'INSERT INTO "{self.TABLE_VERSIONS_TABLE}" (table_name, version, updated_at) VALUES (?, 1, ?) '
+            'ON CONFLICT(table_name) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at',
+            (table_name, datetime.now().isoformat(timespec='seconds'))
+        )
+        self._watch_table(table_name)
+        if not self._in_transaction:
+            self.conn.commit()
+        return self._version(table_name)
+
+    def _snapshot_triggers(self, table_name: str) -> List[str]:
+        return [f"_snapshot_{table_name}_{event}" for event in ('insert', 'update', 'delete')]
+
+    def _watch_table(self, table_name: str):
+        """Install the triggers that bump the version of a table on every write to it.
+
+        They also fire for writes made by other connections and programs, whose changes
+        then make the snapshot stale like this processor's own writes do.
+        """
+        if not self.table_exists(table_name):
+            return
+        for trigger, event in zip(self._snapshot_triggers(table_name), ('INSERT', 'UPDATE', 'DELETE')):
+            self.conn.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {_sql_name(trigger)} AFTER {event} ON {_sql_name(table_name)} BEGIN '
+                f'UPDATE "{self.TABLE_VERSIONS_TABLE}" SET version = version + 1 WHERE table_name = {_sql_literal(table_name)}; END'
+            )
+
+    def _unwatch_table(self, table_name: str):
+        """Drop the version triggers of a table before this processor writes many rows to it.
+
+        Its writes bump the version once through `_invalidate`, which puts the triggers back.
+        """
+        if table_name in self.snapshots:
+            for trigger in self._snapshot_triggers(table_name):
+                self.conn.execute(f'DROP TRIGGER IF EXISTS {_sql_name(trigger)}')
+
+    def _version(self, table_name: str) -> int:
+        return self.conn.execute(
+            f'SELECT version FROM "{self.TABLE_VERSIONS_TABLE}" WHERE table_name = ?', (table_name,)
+        ).fetchone()[0]
+
+    @_writes
+    def _store_snapshot(self, table_name: str, df: pd.DataFrame, version: int):
+        """Write the snapshot of a table at `version` and mark it as current.
+
+        Inside a transaction it is kept until the commit, and dropped on rollback. Nothing
+        is written if the table has changed since that version or its snapshot is already
+        current.
+        """
+        if self._in_transaction:
+            self._pending_snapshots[table_name] = (df, version)
+            return
+        self._ensure_table_versions()
+        row = self.conn.execute(
+            f'SELECT version, snapshot_version FROM "{self.TABLE_VERSIONS_TABLE}" WHERE table_name = ?',
+            (table_name,)
+        ).fetchone()
+        if row is None or row[0] != version or row[1] == version:
+            return
+        self._watch_table(table_name)
+        _write_snapshot(df, self._snapshot_path(table_name), self.snapshot_format)
+        self.conn.execute(
+            f'UPDATE "{self.TABLE_VERSIONS_TABLE}" SET snapshot_version = version WHERE table_name = ? AND version = ?',
+            (table_name, version)
+        )
+        if not self._in_transaction:
+            self.conn.commit()
+
+    def _table_version(self, conn: sqlite3.Connection, table_name: str) -> Optional[tuple]:
+        """(version, snapshot_version, watched) of a table, or None if it was never versioned."""
+        if not self.table_exists(self.TABLE_VERSIONS_TABLE):
+            return None
+        row = conn.execute(
+            f'SELECT version, snapshot_version FROM "{self.TABLE_VERSIONS_TABLE}" WHERE table_name = ?',
+            (table_name,)
+        ).fetchone()
+        if row is None:
+            return None
+        triggers = self._snapshot_triggers(table_name)
+        watched = conn.execute(
+            f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ? "
+            f"AND name IN ({', '.join('?' for _ in triggers)})", [table_name] + triggers
+        ).fetchone()[0] == len(triggers)
+        return row[0], row[1], watched
+
+    def _load_table(self, table_name: str, conn: sqlite3.Connection) -> pd.DataFrame:
+        """Read a whole table, from its snapshot when it is current.
+
+        The snapshot is current when its version is the table's and the version triggers
+        are in place (a table recreated by another program has lost them). A missing or
+        stale snapshot is rebuilt from the rows read from SQLite, if no write committed
+        while they were read.
+        """
+        if table_name not in self.snapshots:
+            return pd.read_sql(f'SELECT * FROM "{table_name}"', conn)
+
+        before = self._table_version(conn, table_name)
+        path = self._snapshot_path(table_name)
+        if before is not None and before[0] == before[1] and before[2] and os.path.exists(path):
+            return _read_snapshot(path, self.snapshot_format)
+
+        df = pd.read_sql(f'SELECT * FROM "{table_name}"', conn)
+        if self._table_version(conn, table_name) != before:
+            return df
+        snapshot = _snapshot_frame(df)
+
+        def store():
+            version = before[0] if before is not None else self._bump_version(table_name)
+            if snapshot is not None:
+                self._store_snapshot(table_name, snapshot, version)
+
+        self._write_soon(store)
+        return df
+
+    def _compact_table(self, table_name: str, df: pd.DataFrame, conn: sqlite3.Connection) -> pd.DataFrame:
+        """Compact the dtypes of a loaded table, reusing and recording its categorical columns."""
+        known = []
+        if self.table_exists(self.DTYPE_HINTS_TABLE):
+            known = [row[0] for row in conn.execute(
+                f'SELECT column_name FROM "{self.DTYPE_HINTS_TABLE}" WHERE table_name = ? AND dtype = ?',
+                (table_name, 'category')
+            )]
+
+        before = int(df.memory_usage(index=False, deep=True).sum())
+        df, categorical = _compact_frame(df, known)
+        after = int(df.memory_usage(index=False, deep=True).sum())
+        self._memory[table_name] = {'bytes_before': before, 'bytes_after': after}
+
+        new = [col for col in categorical if col not in known]
+        if new:
+            self._write_soon(lambda: self._record_dtype_hints(table_name, new))
+        return df
+
+    def _record_dtype_hints(self, table_name: str, categorical: List[str]):
+        self.conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{self.DTYPE_HINTS_TABLE}" ('
+            'table_name TEXT NOT NULL, column_name TEXT NOT NULL, dtype TEXT NOT NULL, '
+            'PRIMARY KEY (table_name, column_name))'
+        )
+        self.conn.executemany(
+            f'INSERT OR REPLACE INTO "{self.DTYPE_HINTS_TABLE}" (table_name, column_name, dtype) VALUES (?, ?, ?)',
+            [(table_name, col, 'category') for col in categorical]
+        )
+        if not self._in_transaction:
+            self.conn.commit()
+
+    def MemoryReport(self) -> Dict[str, Dict[str, int]]:
+        """Memory of each table loaded with `compact_dtypes`, before and after compaction.
+
+        Returns:
+            Dictionary of {table_name: {'bytes_before': ..., 'bytes_after': ...}}
+        """
+        return dict(self._memory)
+
+    def _drop_snapshot(self, table_name: str):
+        if table_name in self.snapshots and os.path.exists(self._snapshot_path(table_name)):
+            os.remove(self._snapshot_path(table_name))
+
+    def _check_data_version(self):
+        """Clear the cache if another connection has committed since the last check.
+
+        `PRAGMA data_version` only changes for commits made by other connections; writes
+        made through this processor invalidate their table explicitly. In concurrent mode
+        the check is skipped while another thread is writing.
+        """
+        with self._writing(wait=False) as writer:
+            if writer is None:
+                return
+            version = writer.execute("PRAGMA data_version").fetchone()[0]
+            if self._data_version is not None and version != self._data_version:
+                self.ClearCache()
+            self._data_version = version
+
+    def _cached_entry(self, table_name: str) -> Dict:
+        """Cache entry of a table, loading it on a miss. Tables over budget are not kept.
+
+        In concurrent mode the table is read without blocking writes, and it is not kept
+        when this processor wrote it while it was read or has not committed it yet.
+        """
+        with self._reading() as conn:
+            self._check_data_version()
+            with self._cache_lock:
+                entry = self._cache.get(table_name)
+                if entry is not None:
+                    self._cache_hits += 1
+                    self._cache.move_to_end(table_name)
+                    return entry
+                self._cache_misses += 1
+                token = self._cache_token(table_name)
+
+            if not self.table_exists(table_name):
+                raise ValueError(f"Table '{table_name}' does not exist")
+            df = self._load_table(table_name, conn)
+            if self.compact_dtypes:
+                df = self._compact_table(table_name, df, conn)
+            entry = {'df': df, 'indexes': {}, 'nbytes': 0}
+
+            if df.memory_usage(index=False).sum() <= self.cache_max_bytes:
+                entry['nbytes'] = int(df.memory_usage(index=False, deep=True).sum())
+                with self._cache_lock:
+                    if entry['nbytes'] <= self.cache_max_bytes and token is not None \
+                            and token == self._cache_token(table_name):
+                        self._cache[table_name] = entry
+                        self._cache_bytes += entry['nbytes']
+                        while self._cache_bytes > self.cache_max_bytes:
+                            _, evicted = self._cache.popitem(last=False)
+                            self._cache_bytes -= evicted['nbytes']
+                            self._cache_evictions += 1
+
+        return entry
+
+    def _lookup_index(self, table_name: str, key: str, normalize: str = None) -> '_LookupIndex':
+        """Join index on `key` of a database table, built once while the table stays cached."""
+        entry = self._cached_entry(table_name)
+        with self._cache_lock:
+            if key not in entry['df'].columns:
+                raise ValueError(f"Join column '{key}' not in source table '{table_name}'")
+            if (key, normalize) not in entry['indexes']:
+                entry['indexes'][(key, normalize)] = _LookupIndex(entry['df'], key, normalize)
+            return entry['indexes'][(key, normalize)]
 
     #-------------------------------------------------------------------   
+    @_instrumented
     def AddColumns(
         self,
         table_name: str,
@@ -71,18 +1842,34 @@ class TableProcessor:
             - `join_on`: str - column in the source table
             - `join_target`: str (optional) - column in `df` to join on (defaults to `join_on`)
             - `source_column`: str (optional) - column to extract from the source table (defaults to new column name)
+            - `normalize`: str (optional) - 'strip' matches the source keys by their text without surrounding whitespace
+        - `dict` with `prefix_rules`: An ordered prefix rule table evaluated column-wise:
+            - `column`: str - column whose text form is tested against the prefixes
+            - `prefix_rules`: list of rules, each a dict with `label` and any of
+              `prefixes` (tuple of str), `first_chars` (iterable of single characters) and
+              `where` ({column: value} equality conditions, compared as text). The first
+              matching rule wins.
+            - `default`: value used when no rule matches
+        - `dict` with `case`: A CASE/WHEN definition evaluated with boolean masks:
+            - `case`: list of (conditions, value) pairs; a pair applies when all its
+              conditions hold and the first one that applies wins
+            - `default`: value for rows no pair applies to
+          Conditions are tuples such as ('eq', column, value), ('in', column, values),
+          ('isna', column), ('concat_eq', columns, value) or ('prefix', column, prefixes).
+          Values are literals, {'column': name}, {'concat': columns} or {'expr': expression}.
         - `Callable`: A function applied row-wise to compute the column.
         
         source_tables : Dict[str, pd.DataFrame], optional
             A dictionary of source DataFrames to use for merges, avoiding redundant database queries.
-            If not provided, tables are retrieved using `self.GetTables()`.
+            Tables not provided are read from the database through the table cache, which also
+            keeps their join indexes between calls.
 
         save_to_db : bool, default=True
             Whether to overwrite the table in the database after processing.
 
         print_unmatched : bool, default=True
-            If True, logs to a file (`merge_warnings.txt`) all the keys in the main DataFrame that 
-            could not find a match during the merge process.
+            If True, records the keys of the main DataFrame that could not find a match during
+            the merge process, and the duplicated source keys, in the `_merge_diagnostics` table.
 
         Returns:
         -------
@@ -97,8 +1884,13 @@ class TableProcessor:
 
         Notes:
         -----
-        - Mismatches during merges are logged in `merge_warnings.txt` with context about the table, 
-        join keys, and unmatched values.
+        - Mismatches during merges are counted from the lookup positions: each distinct unmatched
+        key with its row count, keeping the `DIAGNOSTICS_TOP_KEYS` with most rows (see
+        `MergeDiagnostics`). A one-line summary per join goes to `merge_warnings.txt`, which is
+        not touched when everything matches.
+        - Merges are left lookups: each (source_table, join_on) is indexed once, every requested
+        column is fetched in one pass and the row count of `df` never changes. Source keys that
+        repeat with different values are logged and resolved to their first row.
         - This function is suitable for dynamic feature engineering in ETL workflows or report generation pipelines.
         """
         
@@ -108,7 +1900,7 @@ class TableProcessor:
             df = self.GetTables(table_name)
 
         merge_tasks = {}
-        log_file = open("merge_warnings.txt", "a", encoding="utf-8")
+        diagnostics = []
 
         for new_col, definition in column_definitions.items():
             
@@ -118,6 +1910,12 @@ class TableProcessor:
                 except Exception:
                     raise ValueError(f"Could not evaluate expression: {definition}")
 
+            elif isinstance(definition, dict) and 'prefix_rules' in definition:
+                df[new_col] = _evaluate_prefix_rules(df, definition)
+
+            elif isinstance(definition, dict) and 'case' in definition:
+                df[new_col] = _evaluate_case(df, definition)
+
             elif isinstance(definition, dict):
                 source_table = definition.get('source_table')
                 if not source_table:
@@ -126,11 +1924,12 @@ class TableProcessor:
                 join_on = definition.get('join_on')
                 join_target = definition.get('join_target', join_on)
                 source_col = definition.get('source_column', new_col)
+                normalize = definition.get('normalize')
 
                 if source_table not in merge_tasks:
                     merge_tasks[source_table] = []
 
-                merge_tasks[source_table].append((new_col, join_on, join_target, source_col))
+                merge_tasks[source_table].append((new_col, join_on, join_target, source_col, normalize))
 
             elif callable(definition):
                 try:
@@ -142,55 +1941,423 @@ class TableProcessor:
                 raise ValueError(f"Unsupported definition type for column '{new_col}'")
 
         for source_table, columns in merge_tasks.items():
-            source_df = source_tables.get(source_table) if source_tables else self.GetTables(source_table)
+            if source_tables and source_table in source_tables:
+                source_df = source_tables[source_table]
+            else:
+                source_df = self._cached_entry(source_table)['df']
 
-            for _, join_on, _, source_col in columns:
+            for _, join_on, _, source_col, _ in columns:
                 if join_on not in source_df.columns:
                     raise ValueError(f"Join column '{join_on}' not in source table '{source_table}'")
                 if source_col not in source_df.columns:
                     raise ValueError(f"Source column '{source_col}' not in source table '{source_table}'")
 
-            for new_col, join_on, join_target, source_col in columns:
-                before_merge = df.shape[0]
-                temp_df = df.merge(
-                    source_df[[join_on, source_col]].drop_duplicates(),
-                    how='left',
-                    left_on=join_target,
-                    right_on=join_on
-                ).rename(columns={source_col: new_col})
-
-                unmatched_rows = temp_df[temp_df[new_col].isna()]
-                if not unmatched_rows.empty and print_unmatched:
-                
-                    log_file.write(f"\n--- Registro para la tabla: {table_name} ---\n")
-                    log_file.write(f"\n[Advertencia] {new_col}: {len(unmatched_rows)} filas no coincidentes al unir '{join_target}' -> '{join_on}' desde '{source_table}'\n")
-                    log_file.write(f"\t {unmatched_rows[[join_target]].drop_duplicates().to_string(index=False)}")
-                    log_file.write("\n")
-                    log_file.write(f"--- Fin de la tabla: {table_name} ---\n\n")
-                    
-                df = temp_df
-
-        log_file.close()
+            lookups = {}
+            for new_col, join_on, join_target, source_col, normalize in columns:
+                lookups.setdefault((join_on, join_target, normalize), []).append((new_col, source_col))
+
+            indexes = {}
+            for (join_on, join_target, normalize), fetches in lookups.items():
+                if (join_on, normalize) not in indexes:
+                    if source_tables and source_table in source_tables:
+                        indexes[(join_on, normalize)] = _LookupIndex(source_df, join_on, normalize)
+                    else:
+                        indexes[(join_on, normalize)] = self._lookup_index(source_table, join_on, normalize)
+                index = indexes[(join_on, normalize)]
+
+                join = (table_name, ", ".join(new_col for new_col, _ in fetches), source_table, join_target, join_on)
+                if print_unmatched and index.has_duplicates:
+                    conflicts = index.conflicts([source_col for _, source_col in fetches])
+                    if len(conflicts):
+                        diagnostics.append(join + ('duplicate', index.keys[index.keys.isin(conflicts)].value_counts(dropna=False)))
+
+                positions = index.positions(df[join_target])
+                for new_col, source_col in fetches:
+                    df[new_col] = index.fetch(source_col, positions)
+
+                unmatched = positions < 0
+                if print_unmatched and unmatched.any():
+                    counts = pd.Series(df[join_target].array[unmatched]).value_counts(dropna=False)
+                    diagnostics.append(join + ('unmatched', counts[counts > 0]))
+
+        if diagnostics:
+            self._record_merge_diagnostics(diagnostics)
 
         if save_to_db:
-            df.to_sql(table_name, self.conn, if_exists='replace', index=False)
+            self._write_table(table_name, df)
 
         return df
 
 
+    @_instrumented
+    @_writes
+    def AddColumnsInSQL(self, table_name: str, steps: List[Dict[str, Union[str, Dict]]],
+                        output_table: str = None, drop_columns: List[str] = None) -> int:
+        """Run a sequence of `AddColumns` definitions entirely inside SQLite.
+
+        The steps are compiled into a single `CREATE TABLE ... AS SELECT`, so the table
+        never travels through pandas. Each step is a `column_definitions` dict as passed to
+        `AddColumns` and sees the columns added by the steps before it. Expressions,
+        `case`, `prefix_rules` and join definitions are supported; callables are not.
+        Unmatched join keys are not logged in this mode.
+
+        Args:
+            table_name: Source table
+            steps: Ordered list of column definition dicts
+            output_table: Table to write (defaults to replacing `table_name`)
+            drop_columns: Helper columns left out of the result
+
+        Returns:
+            Number of rows written
+        """
+        self.connect()
+        if not self.table_exists(table_name):
+            raise ValueError(f"Table '{table_name}' does not exist")
+
+        source_columns = {}
+        for definitions in steps:
+            for definition in definitions.values():
+                if isinstance(definition, dict) and 'source_table' in definition:
+                    source_table = definition['source_table']
+                    if source_table not in source_columns:
+                        if not self.table_exists(source_table):
+                            raise ValueError(f"Table '{source_table}' does not exist")
+                        source_columns[source_table] = self.GetColumns(source_table)
+
+        query = _compile_add_columns(table_name, self.GetColumns(table_name), steps,
+                                     source_columns, drop_columns or [])
+
+        output_table = output_table or table_name
+        target = f"{output_table}__sql" if output_table == table_name else output_table
+        with self._transaction():
+            self.conn.execute(f'DROP TABLE IF EXISTS "{target}"')
+            self.conn.execute(f'CREATE TABLE "{target}" AS {query}')
+            if target != output_table:
+                self.conn.execute(f'DROP TABLE "{output_table}"')
+                self.conn.execute(f'ALTER TABLE "{target}" RENAME TO "{output_table}"')
+            self._table_written(output_table)
+
+        self._invalidate(table_name)
+        self._invalidate(output_table)
+        return self.conn.execute(f'SELECT COUNT(*) FROM "{output_table}"').fetchone()[0]
+
+    #-------------------------------------------------------------------
+    def RunSteps(self, df: pd.DataFrame, steps: List[Dict], max_workers: int = None,
+                 progress: Callable[[Dict], None] = None) -> pd.DataFrame:
+        """Run DataFrame steps in a thread pool, each as soon as the steps it depends on are done.
+
+        Each step is a dict with 'name', 'func' (DataFrame -> DataFrame), 'reads' and
+        'writes' (column lists, see `step_columns`; reads None makes the step wait for
+        every earlier step and the later ones wait for it). A step depends on an earlier
+        one when it reads a column the earlier one writes, or writes a column the earlier
+        one reads or writes, so the result is the same as running them in list order.
+
+        Steps get a shallow copy of the frame and only their 'writes' columns are merged
+        back, in the column order sequential execution gives. The run takes as long as
+        the slowest chain of dependent steps, as far as pandas releases the GIL.
+        Steps should not write tables: inside `BulkLoad` the calling thread holds the
+        writer connection until the load ends.
+
+        Args:
+            df: Input DataFrame
+            steps: Steps in their sequential order
+            max_workers: Number of threads (defaults to the `ThreadPoolExecutor` default)
+            progress: Optional callback called with {'name', 'seconds', 'done', 'total'}
+                after each step
+
+        Returns:
+            DataFrame with the columns written by all the steps
+        """
+        self.connect()
+        depends = [{j for j in range(i) if _steps_conflict(steps[j], steps[i])} for i in range(len(steps))]
+        original, written = list(df.columns), {}
+        pending, done, running = set(range(len(steps))), set(), {}
+
+        def run(step, frame):
+            start = time.perf_counter()
+            return self._measure('step', step['name'], step['func'], frame), time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while pending or running:
+                for i in sorted(i for i in pending if depends[i] <= done):
+                    pending.discard(i)
+                    running[pool.submit(run, steps[i], df.copy(deep=False))] = i
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i = running.pop(future)
+                    result, seconds = future.result()
+                    written[i] = [col for col in result.columns if col in steps[i]['writes']]
+                    for col in written[i]:
+                        df[col] = result[col]
+                    done.add(i)
+                    if progress is not None:
+                        progress({'name': steps[i]['name'], 'seconds': seconds, 'done': len(done), 'total': len(steps)})
+
+        order = original
+        for i in range(len(steps)):
+            order.extend(col for col in written[i] if col not in order)
+        return df[order]
+
+    def IterTable(self, table_name: str, chunksize: int = 100000):
+        """Yield a table as DataFrames of at most `chunksize` rows, in table order."""
+        conn = self._read_conn()
+        if not self.table_exists(table_name):
+            raise ValueError(f"Table '{table_name}' does not exist")
+        yield from pd.read_sql(f'SELECT * FROM "{table_name}"', conn, chunksize=chunksize)
+
+    @_instrumented
+    @_writes
+    def TransformTableInChunks(self, table_name: str, func: Callable[[pd.DataFrame], pd.DataFrame],
+                               output_table: str = None, chunksize: int = 100000,
+                               progress: Callable[[Dict], None] = None,
+                               schema: Dict[str, str] = None) -> int:
+        """Stream a table through `func` chunk by chunk and store the result.
+
+        Only one chunk (and its transformed copy) is in memory at a time, so peak memory
+        is set by `chunksize` rather than by the size of the table. `func` must treat rows
+        independently. The output is written in one transaction; when it replaces the
+        source table it is built under a temporary name and swapped in at the end.
+
+        Args:
+            table_name: Source table
+            func: Function receiving a chunk DataFrame and returning the transformed chunk
+            output_table: Table to write (defaults to replacing `table_name`)
+            chunksize: Rows per chunk
+            progress: Optional callback called after each chunk with 'rows_done' and 'rows_total'
+            schema: Ingestion schema of the output. Without one its columns are created
+                with no declared type, so no chunk decides them and every value keeps
+                the type `func` gave it.
+
+        Returns:
+            Number of rows written
+        """
+        self.connect()
+        output_table = output_table or table_name
+        target = f"{output_table}__chunks" if output_table == table_name else output_table
+        rows_total = self.conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+
+        rows = 0
+        with self._transaction():
+            for i, chunk in enumerate(self.IterTable(table_name, chunksize)):
+                result = func(chunk)
+                if schema is not None:
+                    result = _apply_schema(result, schema)
+                if i == 0:
+                    self.conn.execute(f'DROP TABLE IF EXISTS "{target}"')
+                    self.conn.execute(_schema_table_sql(target, schema) if schema is not None
+                                      else _untyped_table_sql(target, result.columns))
+                self._insert_frame(target, result, if_exists='append')
+                rows += len(result)
+                if progress is not None:
+                    progress({'rows_done': rows, 'rows_total': rows_total})
+
+            if target != output_table:
+                self.conn.execute(f'DROP TABLE "{output_table}"')
+                self.conn.execute(f'ALTER TABLE "{target}" RENAME TO "{output_table}"')
+            self._table_written(output_table)
+
+        self._invalidate(table_name)
+        self._invalidate(output_table)
+        return rows
+
+    @_writes
+    def TableFingerprint(self, table_name: str) -> str:
+        """Cheap identifier of a table's current content.
+
+        Uses the content hash recorded in the ingestion manifest when the table was loaded
+        from a file, plus the row count, so a reload of a changed file changes the result.
+        """
+        self.connect()
+        if not self.table_exists(table_name):
+            raise ValueError(f"Table '{table_name}' does not exist")
+
+        self._ensure_manifest()
+        rows = self.conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+        recorded = self.conn.execute(
+            f'SELECT content_hash FROM "{self.MANIFEST_TABLE}" WHERE table_name = ? ORDER BY loaded_at DESC LIMIT 1',
+            (table_name,)
+        ).fetchone()
+        return f"{recorded[0] if recorded else 'sin-manifiesto'}:{rows}"
+
+    @_writes
+    def PendingPartitions(self, table_name: str, partition_column: str,
+                          fingerprints: Dict[str, str]) -> List[str]:
+        """Partitions of `table_name` that have to be (re)built.
+
+        A partition is pending when its fingerprint differs from the one recorded by
+        `UpsertPartition`, or when the rows recorded for it are no longer in the table.
+
+        Args:
+            table_name: Table maintained partition by partition
+            partition_column: Column of `table_name` that holds the partition of each row
+            fingerprints: Current {partition: fingerprint} of every partition
+
+        Returns:
+            List of pending partitions, in the order of `fingerprints`
+        """
+        self.connect()
+        self._ensure_partition_state()
+
+        recorded = {
+            partition: (fingerprint, rows)
+            for partition, fingerprint, rows in self.conn.execute(
+                f'SELECT partition, fingerprint, row_count FROM "{self.PARTITION_STATE_TABLE}" WHERE table_name = ?',
+                (table_name,)
+            )
+        }
+
+        present = {}
+        if self.table_exists(table_name) and partition_column in self.GetColumns(table_name):
+            present = dict(self.conn.execute(
+                f'SELECT "{partition_column}", COUNT(*) FROM "{table_name}" GROUP BY "{partition_column}"'
+            ).fetchall())
+
+        return [
+            partition for partition, fingerprint in fingerprints.items()
+            if recorded.get(partition) != (fingerprint, present.get(partition, 0))
+        ]
+
+    @_writes
+    def PartitionsRecorded(self, table_name: str) -> List[str]:
+        """Partitions of `table_name` recorded by `UpsertPartition`."""
+        self.connect()
+        self._ensure_partition_state()
+        return [row[0] for row in self.conn.execute(
+            f'SELECT partition FROM "{self.PARTITION_STATE_TABLE}" WHERE table_name = ?', (table_name,)
+        )]
+
+    @_instrumented
+    @_writes
+    def UpsertPartition(self, table_name: str, df: pd.DataFrame, partition_column: str,
+                        partition: str, fingerprint: str = None):
+        """Replace the rows of one partition of a table and record its fingerprint.
+
+        The table is created if needed, and columns of `df` it does not have yet are added,
+        so partitions written by different versions of a pipeline can coexist.
+        An empty `df` just removes the partition.
+
+        Args:
+            table_name: Target table
+            df: Rows of the partition (their `partition_column` is set to `partition`)
+            partition_column: Column that identifies the partition of each row
+            partition: Partition being written
+            fingerprint: Fingerprint of the source of the partition, for `PendingPartitions`
+        """
+        self.connect()
+        self._ensure_partition_state()
+        df = df.assign(**{partition_column: partition})
+
+        with self._transaction():
+            if self.table_exists(table_name):
+                self._unwatch_table(table_name)
+                existing = self.GetColumns(table_name)
+                for column in df.columns:
+                    if column not in existing:
+                        self.conn.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{column}"')
+                if partition_column in existing:
+                    self.conn.execute(f'DELETE FROM "{table_name}" WHERE "{partition_column}" = ?', (partition,))
+
+            if len(df):
+                self._insert_frame(table_name, df, if_exists='append')
+                self.conn.execute(
+                    f'INSERT OR REPLACE INTO "{self.PARTITION_STATE_TABLE}" '
+                    '(table_name, partition, fingerprint, row_count, updated_at) VALUES (?, ?, ?, ?, ?)',
+                    (table_name, partition, fingerprint, len(df), datetime.now().isoformat(timespec='seconds'))
+                )
+            else:
+                self.conn.execute(
+                    f'DELETE FROM "{self.PARTITION_STATE_TABLE}" WHERE table_name = ? AND partition = ?',
+                    (table_name, partition)
+                )
+
+        self._invalidate(table_name)
+
+    @_instrumented
+    @_writes
+    def MaterializeAggregate(self, source_table: str, output_table: str, dimensions: List[str],
+                             measures: List[str], partition_column: str = None,
+                             partitions: List[str] = None) -> int:
+        """Store the SUM of `measures` grouped by `dimensions` as a table.
+
+        Reports that roll the aggregate up again (e.g. `PivotTables` over it) read one row
+        per group instead of the detail rows. If `partition_column` exists in the source it
+        is kept as an extra dimension, and passing `partitions` then refreshes only those
+        partitions of an existing aggregate instead of rebuilding it.
+
+        Args:
+            source_table: Detail table
+            output_table: Aggregate table to create or refresh
+            dimensions: Group-by columns
+            measures: Columns to sum
+            partition_column: Optional partition column of the source
+            partitions: Partitions to refresh (None rebuilds the whole aggregate)
+
+        Returns:
+            Number of rows of the aggregate
+        """
+        self.connect()
+        source_columns = self.GetColumns(source_table)
+        if not source_columns:
+            raise ValueError(f"Table '{source_table}' does not exist")
+        missing = [col for col in dimensions + measures if col not in source_columns]
+        if missing:
+            raise ValueError(f"Columns {missing} not in table '{source_table}'")
+
+        partitioned = partition_column is not None and partition_column in source_columns
+        if partitioned:
+            dimensions = [partition_column] + [col for col in dimensions if col != partition_column]
+
+        group = ", ".join(_sql_name(col) for col in dimensions)
+        sums = ", ".join(f"SUM({_sql_name(col)}) AS {_sql_name(col)}" for col in measures)
+        query = f"SELECT {group}, {sums} FROM {_sql_name(source_table)}"
+
+        refresh = (partitioned and partitions is not None
+                   and partition_column in self.GetColumns(output_table))
+
+        with self._transaction():
+            if refresh:
+                self._unwatch_table(output_table)
+                placeholders = ", ".join("?" for _ in partitions)
+                self.conn.execute(f'DELETE FROM {_sql_name(output_table)} WHERE {_sql_name(partition_column)} IN ({placeholders})',
+                                  list(partitions))
+                self.conn.execute(f'INSERT INTO {_sql_name(output_table)} ({group}, {", ".join(_sql_name(col) for col in measures)}) '
+                                  f'{query} WHERE {_sql_name(partition_column)} IN ({placeholders}) GROUP BY {group}',
+                                  list(partitions))
+            else:
+                self.conn.execute(f'DROP TABLE IF EXISTS {_sql_name(output_table)}')
+                self.conn.execute(f'CREATE TABLE {_sql_name(output_table)} AS {query} GROUP BY {group}')
+            self._table_written(output_table)
+
+        self._invalidate(output_table)
+        return self.conn.execute(f'SELECT COUNT(*) FROM {_sql_name(output_table)}').fetchone()[0]
+
+    def _ensure_partition_state(self):
+        self.conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{self.PARTITION_STATE_TABLE}" ('
+            'table_name TEXT NOT NULL, partition TEXT NOT NULL, fingerprint TEXT, '
+            'row_count INTEGER, updated_at TEXT, PRIMARY KEY (table_name, partition))'
+        )
+
+    def GetColumns(self, table_name: str) -> List[str]:
+        """Column names of a database table, in table order."""
+        return [row[1] for row in self._read_conn().execute(f'PRAGMA table_info("{table_name}")')]
+
     def ListTables(self) -> List[str]:
         """List all tables in the database.
         
         Returns:
             List of table names in the database
         """
-        self.connect()
         query = "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
-        tables = pd.read_sql(query, self.conn)['name'].tolist()
+        tables = pd.read_sql(query, self._read_conn())['name'].tolist()
         return tables
     
+    @_instrumented
     def ImportFromExcel(self, excel_path: str, sheet_name: str = None, 
-                       table_name: str = None, if_exists: str = 'replace'):
+                       table_name: str = None, if_exists: str = 'replace',
+                       engine: str = None, batch_size: int = 50000,
+                       skip_unchanged: bool = False, schema: Dict[str, str] = None) -> int:
         """Import data from Excel file to database table.
         
         Args:
@@ -198,6 +2365,21 @@ class TableProcessor:
             sheet_name: Name of the Excel sheet to import (defaults to first sheet)
             table_name: Name for the database table (defaults to Excel filename without extension)
             if_exists: What to do if table exists ('fail', 'replace', 'append')
+            engine: None or 'pandas' loads the whole sheet with `pd.read_excel`. A streaming
+                engine from `EXCEL_ROW_READERS` ('openpyxl', 'calamine') reads the sheet in
+                batches of `batch_size` rows that go straight to the table, so memory
+                stays bounded by the batch size instead of the sheet size. Streaming
+                engines keep cell values as the reader returns them (text stays text,
+                calamine returns numbers as floats) instead of re-inferring types.
+                Without a schema they read the sheet twice: a first pass infers the
+                column types from all its values (see `_infer_schema`).
+            batch_size: Rows per batch for streaming engines
+            skip_unchanged: Skip the file if the ingestion manifest shows it was already
+                loaded into `table_name` and its content has not changed since
+            schema: Ingestion schema of the table (defaults to `schemas[table_name]`)
+
+        Returns:
+            Number of rows imported (0 when the file was skipped)
         """
         if not os.path.exists(excel_path):
             raise FileNotFoundError(f"Excel file not found: {excel_path}")
@@ -206,9 +2388,208 @@ class TableProcessor:
             table_name = os.path.splitext(os.path.basename(excel_path))[0]
             
         self.connect()
-        df = pd.read_excel(excel_path, sheet_name=sheet_name)
-        df.to_sql(table_name, self.conn, if_exists=if_exists, index=False)
+
+        unchanged, content_hash = self._manifest_check(excel_path, table_name)
+        if skip_unchanged and unchanged:
+            return 0
+
+        schema = schema if schema is not None else self.schemas.get(table_name)
+        if engine in (None, 'pandas'):
+            df = _read_excel(excel_path, sheet_name, schema=schema)
+            self._write_table(table_name, df, if_exists=if_exists, schema=schema)
+            rows = len(df)
+        else:
+            # The column types are declared before the first batch, never taken from it
+            if schema is None:
+                schema = _infer_schema(_iter_excel_batches(excel_path, sheet_name, engine, batch_size))
+            rows = 0
+            with self._transaction():
+                for i, batch in enumerate(_iter_excel_batches(excel_path, sheet_name, engine, batch_size)):
+                    batch = _apply_schema(batch, schema)
+                    self._insert_frame(table_name, batch, if_exists=if_exists if i == 0 else 'append', schema=schema)
+                    rows += len(batch)
+
+        self._record_ingestion(excel_path, table_name, rows, content_hash)
+        return rows
         
+    @_instrumented
+    def ImportSheetsFromExcel(self, excel_path: str, sheets: Union[List[str], Dict[str, str]],
+                              if_exists: str = 'replace') -> Dict[str, int]:
+        """Import several sheets of one Excel file, parsing the workbook only once.
+
+        All the tables are written inside a single transaction, so either every sheet
+        is loaded or none is.
+
+        Args:
+            excel_path: Path to Excel file
+            sheets: Sheet names (each loaded into a table of the same name), or a
+                {sheet_name: table_name} dictionary
+            if_exists: What to do if a table exists ('fail', 'replace', 'append')
+
+        Tables with an entry in `schemas` keep only its columns, with the declared types.
+
+        Returns:
+            Dictionary of {table_name: rows loaded}
+        """
+        if not os.path.exists(excel_path):
+            raise FileNotFoundError(f"Excel file not found: {excel_path}")
+
+        if not isinstance(sheets, dict):
+            sheets = {sheet: sheet for sheet in sheets}
+
+        # Each sheet is parsed with the options of its table's schema, like `_read_excel` does
+        frames = {}
+        with pd.ExcelFile(excel_path) as workbook:
+            for sheet_name, table_name in sheets.items():
+                schema = self.schemas.get(table_name)
+                df = workbook.parse(sheet_name, **_read_options(schema))
+                frames[sheet_name] = _apply_schema(df, schema) if schema is not None else df
+
+        loaded = {}
+        content_hash = _file_hash(excel_path)
+        with self._transaction():
+            for sheet_name, table_name in sheets.items():
+                df, schema = frames[sheet_name], self.schemas.get(table_name)
+                self._insert_frame(table_name, df, if_exists=if_exists, schema=schema)
+                loaded[table_name] = len(df)
+                self._record_ingestion(excel_path, table_name, loaded[table_name], content_hash)
+        return loaded
+
+    @_instrumented
+    def ImportManyFromExcel(self, jobs: List[tuple], max_workers: int = None,
+                            if_exists: str = 'replace',
+                            progress: Callable[[Dict], None] = None,
+                            engine: str = None,
+                            skip_unchanged: bool = False,
+                            schema: Dict[str, str] = None) -> List[Dict]:
+        """Import several Excel files, parsing them in parallel.
+
+        Workbooks are parsed in a pool of worker processes while this process stays the
+        only writer to the database, storing each frame as soon as it is parsed.
+        A file that fails is reported in its status and does not stop the others.
+
+        Args:
+            jobs: List of (excel_path, sheet_name, table_name) tuples
+            max_workers: Number of parser processes (defaults to the number of CPUs)
+            if_exists: What to do if a table exists ('fail', 'replace', 'append')
+            progress: Optional callback called with the status dict of each finished file,
+                extended with 'done', 'total', 'rows_total' and 'elapsed' for the batch
+            engine: Excel reader used by the workers (see `ImportFromExcel`)
+            skip_unchanged: Skip files the ingestion manifest shows as already loaded
+                and unchanged
+            schema: Ingestion schema applied to every file, by the parser processes
+                (defaults to `schemas[table_name]` of each job)
+
+        Returns:
+            One status dict per file with 'path', 'table', 'status' ('loaded', 'skipped'
+            or 'failed'), 'rows', 'seconds' and 'error'
+        """
+        self.connect()
+        results = []
+        rows_total = 0
+        start = time.perf_counter()
+
+        def report(status):
+            results.append(status)
+            if progress is not None:
+                progress(dict(status, done=len(results), total=len(jobs),
+                              rows_total=rows_total, elapsed=time.perf_counter() - start))
+
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {}
+            for excel_path, sheet_name, table_name in jobs:
+                if table_name is None:
+                    table_name = os.path.splitext(os.path.basename(excel_path))[0]
+
+                status = {'path': excel_path, 'table': table_name, 'status': 'loaded', 'rows': 0, 'seconds': 0.0, 'error': None}
+                try:
+                    unchanged, content_hash = self._manifest_check(excel_path, table_name)
+                except OSError as e:
+                    report(dict(status, status='failed', error=f"{type(e).__name__}: {e}"))
+                    continue
+                if skip_unchanged and unchanged:
+                    report(dict(status, status='skipped'))
+                    continue
+
+                table_schema = schema if schema is not None else self.schemas.get(table_name)
+                future = pool.submit(_read_excel_job, excel_path, sheet_name, engine, table_schema)
+                futures[future] = (status, table_schema, content_hash, time.perf_counter())
+
+            for future in as_completed(futures):
+                status, table_schema, content_hash, submitted = futures[future]
+
+                try:
+                    df = future.result()
+                    self._write_table(status['table'], df, if_exists=if_exists, schema=table_schema)
+                    self._record_ingestion(status['path'], status['table'], len(df), content_hash)
+                    status['rows'] = len(df)
+                except Exception as e:
+                    status['status'] = 'failed'
+                    status['error'] = f"{type(e).__name__}: {e}"
+
+                status['seconds'] = time.perf_counter() - submitted
+                rows_total += status['rows']
+                report(status)
+
+        return results
+
+    #-------------------------------------------------------------------
+    @_writes
+    def _manifest_check(self, excel_path: str, table_name: str):
+        """Whether `excel_path` is unchanged since it was last loaded into `table_name`.
+
+        Size and mtime are compared first; the file is only hashed when they differ, in
+        which case an identical hash just refreshes the recorded mtime.
+
+        Returns:
+            (unchanged, content hash or None if it was not computed)
+        """
+        self.connect()
+        self._ensure_manifest()
+        stat = os.stat(excel_path)
+        recorded = self.conn.execute(
+            f'SELECT size, mtime, content_hash FROM "{self.MANIFEST_TABLE}" WHERE path = ? AND table_name = ?',
+            (os.path.abspath(excel_path), table_name)
+        ).fetchone()
+
+        if recorded is None or not self.table_exists(table_name) or recorded[0] != stat.st_size:
+            return False, None
+        if recorded[1] == stat.st_mtime:
+            return True, recorded[2]
+
+        content_hash = _file_hash(excel_path)
+        if content_hash != recorded[2]:
+            return False, content_hash
+
+        self.conn.execute(
+            f'UPDATE "{self.MANIFEST_TABLE}" SET mtime = ? WHERE path = ? AND table_name = ?',
+            (stat.st_mtime, os.path.abspath(excel_path), table_name)
+        )
+        if not self._in_transaction:
+            self.conn.commit()
+        return True, content_hash
+
+    @_writes
+    def _record_ingestion(self, excel_path: str, table_name: str, rows: int, content_hash: str = None):
+        """Store what was loaded from `excel_path` into `table_name` in the ingestion manifest."""
+        self._ensure_manifest()
+        stat = os.stat(excel_path)
+        self.conn.execute(
+            f'INSERT OR REPLACE INTO "{self.MANIFEST_TABLE}" '
+            '(path, table_name, size, mtime, content_hash, row_count, loaded_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (os.path.abspath(excel_path), table_name, stat.st_size, stat.st_mtime,
+             content_hash or _file_hash(excel_path), rows, datetime.now().isoformat(timespec='seconds'))
+        )
+        if not self._in_transaction:
+            self.conn.commit()
+
+    def _ensure_manifest(self):
+        self.conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{self.MANIFEST_TABLE}" ('
+            'path TEXT NOT NULL, table_name TEXT NOT NULL, size INTEGER, mtime REAL, '
+            'content_hash TEXT, row_count INTEGER, loaded_at TEXT, PRIMARY KEY (path, table_name))'
+        )
+
     def PrintColumns(self, table_name: str) -> List[str]:
         """Print and return the columns of a specific table.
         
@@ -224,7 +2605,7 @@ class TableProcessor:
             raise ValueError(f"Table '{table_name}' does not exist in the database")
             
         query = f"PRAGMA table_info({table_name})"
-        columns_info = pd.read_sql(query, self.conn)
+        columns_info = pd.read_sql(query, self._read_conn())
         columns = columns_info['name'].tolist()
         
         print(f"\nColumns in table '{table_name}':")
@@ -233,27 +2614,74 @@ class TableProcessor:
             
         return columns
     
+    @_instrumented
     def ExportToExcel(self, table_name: str, output_path: str = None, 
-                     sheet_name: str = "Sheet1"):
-        """Export a database table to Excel file.
-        
+                     sheet_name: str = "Sheet1", df: pd.DataFrame = None,
+                     batch_size: int = 10000, max_rows_per_sheet: int = EXCEL_MAX_ROWS - 1) -> Dict:
+        """Export a database table (or a DataFrame already in hand) to an Excel file.
+
+        Rows are streamed in batches of `batch_size` to openpyxl's write-only workbook,
+        straight from a SQLite cursor when `df` is not given, so memory stays bounded
+        by the batch size instead of the table size. Past `max_rows_per_sheet` rows the
+        export continues in new sheets named `sheet_name_2`, `sheet_name_3`...
+
         Args:
             table_name: Name of the table to export
             output_path: Path for the output Excel file (defaults to table_name.xlsx)
             sheet_name: Name of the Excel sheet to create
+            df: Contents of `table_name` when the caller already has them, which avoids
+                reading the table back from the database
+            batch_size: Rows fetched and written per batch
+            max_rows_per_sheet: Data rows per sheet, below the header
+
+        Returns:
+            Dictionary with 'rows', 'sheets', 'bytes' and 'seconds'
         """
+        import openpyxl
+
         self.connect()
-        
-        if not self.table_exists(table_name):
+        if df is None and not self.table_exists(table_name):
             raise ValueError(f"Table '{table_name}' does not exist in the database")
-            
+        if not 0 < max_rows_per_sheet < EXCEL_MAX_ROWS:
+            raise ValueError(f"max_rows_per_sheet must be between 1 and {EXCEL_MAX_ROWS - 1}")
+
         if output_path is None:
             output_path = f"{table_name}.xlsx"
-            
-        df = self.GetTables(table_name)
-        df.to_excel(output_path, sheet_name=sheet_name, index=False)
-        print(f"Table '{table_name}' exported to {output_path}")
+        sheet_name = sheet_name or "Sheet1"
 
+        start = time.perf_counter()
+        if df is None:
+            cursor = self._read_conn().execute(f'SELECT * FROM {_sql_name(table_name)}')
+            header = [column[0] for column in cursor.description]
+            batches = iter(lambda: cursor.fetchmany(batch_size), [])
+        else:
+            header = [str(column) for column in df.columns]
+            batches = _frame_row_batches(df, batch_size)
+
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet, sheet_rows, sheets, rows = None, 0, 0, 0
+        for batch in batches:
+            for row in batch:
+                if sheet is None or sheet_rows == max_rows_per_sheet:
+                    sheets += 1
+                    sheet = workbook.create_sheet(sheet_name if sheets == 1 else f"{sheet_name[:27]}_{sheets}")
+                    sheet.append(header)
+                    sheet_rows = 0
+                sheet.append(row)
+                sheet_rows += 1
+            rows += len(batch)
+        if sheet is None:
+            sheets = 1
+            workbook.create_sheet(sheet_name).append(header)
+        workbook.save(output_path)
+
+        seconds = time.perf_counter() - start
+        size = os.path.getsize(output_path)
+        print(f"Table '{table_name}' exported to {output_path} ({rows:,} rows, {sheets} sheet(s), "
+              f"{size / 1024 ** 2:,.1f} MB in {seconds:.1f} s, {size / max(seconds, 1e-9) / 1024 ** 2:,.1f} MB/s)")
+        return {'rows': rows, 'sheets': sheets, 'bytes': size, 'seconds': seconds}
+
+    @_instrumented
     def GetTables(self, table_names: Union[str, List[str]]) -> Union[pd.DataFrame, Dict[str, pd.DataFrame]]:
         """Retrieve one or more tables from the SQLite database.
         
@@ -261,7 +2689,8 @@ class TableProcessor:
             table_names: Single table name or list of table names
             
         Returns:
-            Single DataFrame if one table requested, or dictionary of DataFrames
+            Single DataFrame if one table requested, or dictionary of DataFrames.
+            Tables served from the cache are returned as copies, so callers may modify them.
             
         Raises:
             ValueError: If any requested table doesn't exist
@@ -271,7 +2700,7 @@ class TableProcessor:
         if isinstance(table_names, str):
             if not self.table_exists(table_names):
                 raise ValueError(f"Table '{table_names}' does not exist")
-            return pd.read_sql(f'SELECT * FROM "{table_names}"', self.conn)
+            return self._get_table(table_names)
         
         # Check all tables exist first
         for name in table_names:
@@ -280,22 +2709,79 @@ class TableProcessor:
         
         tables = {}
         for name in table_names:
-            tables[name] = pd.read_sql(f"SELECT * FROM {name}", self.conn)
+            tables[name] = self._get_table(name)
         return tables
+
+    def _get_table(self, table_name: str) -> pd.DataFrame:
+        df = self._cached_entry(table_name)['df']
+        return df.copy() if table_name in self._cache else df
     
-    def ConcatTables(self, tables: List[pd.DataFrame], output_table: str, axis: int = 0, **kwargs):
+    @_instrumented
+    def ConcatTables(self, tables: List[Union[pd.DataFrame, str]], output_table: str, axis: int = 0, **kwargs):
         """Concatenate multiple tables along an axis and save to database.
+
+        When every table is given by name and the concatenation is row-wise, the rows
+        are copied with INSERT ... SELECT inside SQLite and never loaded into pandas.
         
         Args:
-            tables: List of DataFrames to concatenate
+            tables: List of DataFrames, or of database table names, to concatenate
             output_table: Name for the output table in database
             axis: 0 for row-wise concatenation, 1 for column-wise
             **kwargs: Additional arguments to pd.concat
         """
         self.connect()
+
+        if tables and all(isinstance(table, str) for table in tables):
+            if axis == 0 and not kwargs:
+                self._concat_in_sql(tables, output_table)
+                return
+            tables = [self.GetTables(table) for table in tables]
         
         concatenated = pd.concat(tables, axis=axis, **kwargs)
-        concatenated.to_sql(output_table, self.conn, if_exists='replace', index=False)
+        self._write_table(output_table, concatenated)
+
+    @_writes
+    def _concat_in_sql(self, tables: List[str], output_table: str):
+        """Row-wise concatenation of database tables, aligning columns by name like `pd.concat`.
+
+        Columns missing from a table are filled with NULL. A column keeps its declared
+        type when all tables agree, becomes REAL when they mix INTEGER and REAL (or it is
+        missing from some table, as pandas turns such integers into floats) and TEXT otherwise.
+        """
+        declared = {}
+        for table in tables:
+            info = self.conn.execute(f'PRAGMA table_info({_sql_name(table)})').fetchall()
+            if not info:
+                raise ValueError(f"Table '{table}' does not exist")
+            for _, column, column_type, *_ in info:
+                declared.setdefault(column, []).append(column_type.upper())
+
+        types = {}
+        for column, column_types in declared.items():
+            distinct = set(column_types)
+            if len(distinct) == 1 and (len(column_types) == len(tables) or distinct != {'INTEGER'}):
+                types[column] = column_types[0]
+            elif distinct <= {'INTEGER', 'REAL'}:
+                types[column] = 'REAL'
+            else:
+                types[column] = 'TEXT'
+
+        target = f"{output_table}__concat" if output_table in tables else output_table
+        columns = ", ".join(_sql_name(column) for column in types)
+        with self._transaction():
+            self.conn.execute(f'DROP TABLE IF EXISTS {_sql_name(target)}')
+            self.conn.execute(f'CREATE TABLE {_sql_name(target)} '
+                              f'({", ".join(f"{_sql_name(column)} {types[column]}" for column in types)})')
+            for table in tables:
+                present = {row[1] for row in self.conn.execute(f'PRAGMA table_info({_sql_name(table)})')}
+                select = ", ".join(_sql_name(column) if column in present else "NULL" for column in types)
+                self.conn.execute(f'INSERT INTO {_sql_name(target)} ({columns}) SELECT {select} FROM {_sql_name(table)}')
+            if target != output_table:
+                self.conn.execute(f'DROP TABLE {_sql_name(output_table)}')
+                self.conn.execute(f'ALTER TABLE {_sql_name(target)} RENAME TO {_sql_name(output_table)}')
+            self._table_written(output_table)
+
+        self._invalidate(output_table)
         
     def MergeTables(self, left: pd.DataFrame, right: pd.DataFrame, output_table: str, 
                     how: str = 'inner', on: Optional[Union[str, List[str]]] = None, **kwargs):
@@ -312,9 +2798,10 @@ class TableProcessor:
         self.connect()
         
         merged = pd.merge(left, right, how=how, on=on, **kwargs)
-        merged.to_sql(output_table, self.conn, if_exists='replace', index=False)
+        self._write_table(output_table, merged)
         
-    def PivotTables(self, df: pd.DataFrame, output_table: str, 
+    @_instrumented
+    def PivotTables(self, df: Union[pd.DataFrame, str], output_table: str, 
                 rows: Union[str, List[str]] = None,
                 columns: Union[str, List[str]] = None,
                 values: Union[str, List[str]] = None,
@@ -322,9 +2809,14 @@ class TableProcessor:
                 aggfunc: Union[str, callable, Dict] = 'sum',
                 **kwargs):
         """Create a pivot table from the input DataFrame and save to database.
+
+        When `df` is a table name the filters, the column projection and, for 'sum',
+        'mean', 'min', 'max' and 'count', the aggregation run in SQLite as a GROUP BY over
+        the row and column fields. Only the aggregated groups are loaded and reshaped
+        with pandas, so the cost follows the number of groups rather than rows.
         
         Args:
-            df: Input DataFrame
+            df: Input DataFrame, or the name of a database table
             output_table: Name for the output table in database
             rows: Column(s) to use as rows (equivalent to Excel's "Rows" area)
             columns: Column(s) to use as columns (equivalent to Excel's "Columns" area)
@@ -335,6 +2827,10 @@ class TableProcessor:
         """
         self.connect()
 
+        if isinstance(df, str):
+            df, aggfunc = self._pivot_source(df, rows, columns, values, filters, aggfunc, kwargs.get('margins', False))
+            filters = None
+
         if filters:
             for col, filter_values in filters.items():
                 if col in df.columns:
@@ -347,15 +2843,54 @@ class TableProcessor:
                                 aggfunc=aggfunc,
                                 **kwargs)
         
-        if isinstance(pivoted.index, pd.MultiIndex):
+        if rows is not None:
             pivoted.reset_index(inplace=True)
             
         if isinstance(pivoted.columns, pd.MultiIndex):
-            pivoted.columns = [' '.join(str(col)).strip() for col in pivoted.columns.values]
+            pivoted.columns = ['_'.join(str(level) for level in col if str(level) != '') for col in pivoted.columns.values]
         
-        pivoted.to_sql(output_table, self.conn, if_exists='replace', index=False)
+        self._write_table(output_table, pivoted)
         return pivoted
 
+    def _pivot_source(self, table_name: str, rows, columns, values, filters: Dict[str, List],
+                      aggfunc, margins: bool = False):
+        """Load what a pivot of a database table needs, filtered and if possible aggregated in SQL.
+
+        Returns:
+            Tuple of (DataFrame, aggfunc to finish the pivot with). Pre-aggregated groups
+            are finished with the function that combines them ('sum' for counts).
+        """
+        as_list = lambda fields: [] if fields is None else [fields] if isinstance(fields, str) else list(fields)
+        keys, values = as_list(rows) + as_list(columns), as_list(values)
+
+        table_columns = self.GetColumns(table_name)
+        if not table_columns:
+            raise ValueError(f"Table '{table_name}' does not exist")
+        missing = [col for col in keys + values if col not in table_columns]
+        if missing:
+            raise ValueError(f"Columns {missing} not in table '{table_name}'")
+
+        where, params = [], []
+        for col, filter_values in (filters or {}).items():
+            if col in table_columns:
+                filter_values = list(filter_values)
+                where.append(f"{_sql_name(col)} IN ({', '.join('?' for _ in filter_values)})")
+                params.extend(value.item() if isinstance(value, np.generic) else value for value in filter_values)
+        where = f" WHERE {' AND '.join(where)}" if where else ""
+
+        pushdown = (isinstance(aggfunc, str) and aggfunc in _SQL_AGGREGATES and keys and values
+                    and not set(keys) & set(values) and not (margins and aggfunc == 'mean'))
+        if pushdown:
+            function, finish = _SQL_AGGREGATES[aggfunc]
+            group = ", ".join(_sql_name(col) for col in keys)
+            aggregates = ", ".join(f"{function}({_sql_name(col)}) AS {_sql_name(col)}" for col in values)
+            query = f"SELECT {group}, {aggregates} FROM {_sql_name(table_name)}{where} GROUP BY {group}"
+            return pd.read_sql(query, self._read_conn(), params=params), finish
+
+        projection = ", ".join(_sql_name(col) for col in dict.fromkeys(keys + values)) if values else "*"
+        query = f"SELECT {projection} FROM {_sql_name(table_name)}{where}"
+        return pd.read_sql(query, self._read_conn(), params=params), aggfunc
+
     def execute_sql(self, query: str, params: tuple = None) -> pd.DataFrame:
         """Execute a raw SQL query and return results as DataFrame.
         
@@ -365,9 +2900,10 @@ class TableProcessor:
             
         Returns:
             DataFrame containing query results
+
+        In concurrent mode the query runs on a read-only connection, so it can only read.
         """
-        self.connect()
-        return pd.read_sql(query, self.conn, params=params)
+        return pd.read_sql(query, self._read_conn(), params=params)
 
     def DropTable(self, table_name: str, confirm: bool = True) -> bool:
         """Drop/delete a table from the SQLite database.
@@ -393,19 +2929,22 @@ class TableProcessor:
                 print("Table drop cancelled")
                 return False
         
-        try:
-            self.conn.execute(f"DROP TABLE {table_name}")
-            self.conn.commit()
-            print(f"Table '{table_name}' successfully dropped")
-            return True
-        
-        except Exception as e:
-            self.conn.rollback()
-            raise RuntimeError(f"Error dropping table '{table_name}': {str(e)}")
+        with self._writing():
+            # Inside BulkLoad or another transaction the drop joins it, and the caller
+            # decides whether it is committed or rolled back
+            try:
+                with self._transaction():
+                    self.conn.execute(f"DROP TABLE {_sql_name(table_name)}")
+            except sqlite3.Error as e:
+                raise RuntimeError(f"Error dropping table '{table_name}': {str(e)}")
+            self._invalidate(table_name)
+            self._drop_snapshot(table_name)
+
+        print(f"Table '{table_name}' successfully dropped")
+        return True
 
     def table_exists(self, table_name: str) -> bool:
         """Check if a table exists in the database."""
-        self.connect()
-        cursor = self.conn.cursor()
+        cursor = self._read_conn().cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
         return cursor.fetchone() is not None
\ No newline at end of file
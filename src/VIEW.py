@@ -20,6 +20,11 @@ FUNCIONES:
     4. PIVOTEAR & DESCARGAR [VENTA BRUTA]
     5. PIVOTEAR & DESCARGAR [VENTA NETA] 
     6. PIVOTEAR & DESCARGAR [VENTA POR CANAL] 
+    13. COMPLETAR VENTA HISTORICA [INCREMENTAL]
+    14. COMPLETAR VENTA HISTORICA [POR BLOQUES]
+    15. COMPLETAR VENTA HISTORICA [SQL]
+    16. VERIFICAR COMPLETAR [PANDAS VS SQL]
+    17. RENDIMIENTO [ULTIMA EJECUCION]
 
 CONTROL:
     6. TABLAS EN LA BASE DE DATOS
@@ -41,17 +46,17 @@ def main_menu(processor: MODEL.TableProcessor):
         choice = input(f"Ingrese una opción: ")
 
         if choice == "1":
-            CONTROLLER._cargarVentaHistorica(processor)
+            CONTROLLER._medir(processor, "CARGAR VENTA HISTORICA", CONTROLLER._cargarVentaHistorica)
         elif choice == "2":
-            CONTROLLER._concatenateTabels(processor)
+            CONTROLLER._medir(processor, "CONCATENAR VENTA HISTORICA", CONTROLLER._concatenateTabels)
         elif choice == "3":
-            CONTROLLER._completarVentaHistorica(processor)
+            CONTROLLER._medir(processor, "COMPLETAR VENTA HISTORICA", CONTROLLER._completarVentaHistorica)
         elif choice == "4":
-            CONTROLLER._pivotearDescargar_VENTA_BRUTA(processor)
+            CONTROLLER._medir(processor, "VENTA BRUTA", CONTROLLER._pivotearDescargar_VENTA_BRUTA)
         elif choice == "5":
-            CONTROLLER._pivotearDescargar_VENTA_NETA(processor)
+            CONTROLLER._medir(processor, "VENTA NETA", CONTROLLER._pivotearDescargar_VENTA_NETA)
         elif choice == "6":
-            CONTROLLER._pivotearDescargar_VENTA_POR_CANAL(processor)
+            CONTROLLER._medir(processor, "VENTA POR CANAL", CONTROLLER._pivotearDescargar_VENTA_POR_CANAL)
 
         elif choice == "7":
             CONTROLLER._listDataBase(processor)
@@ -65,6 +70,16 @@ def main_menu(processor: MODEL.TableProcessor):
             CONTROLLER._downloadExcelFromDataBase(processor)
         elif choice == "12":
             CONTROLLER._pivoteTabels(processor)
+        elif choice == "13":
+            CONTROLLER._medir(processor, "COMPLETAR [INCREMENTAL]", CONTROLLER._completarVentaHistoricaIncremental)
+        elif choice == "14":
+            CONTROLLER._medir(processor, "COMPLETAR [POR BLOQUES]", CONTROLLER._completarVentaHistoricaPorBloques)
+        elif choice == "15":
+            CONTROLLER._medir(processor, "COMPLETAR [SQL]", CONTROLLER._completarVentaHistoricaSQL)
+        elif choice == "16":
+            CONTROLLER._verificarVentaHistoricaSQL(processor)
+        elif choice == "17":
+            CONTROLLER._mostrarRendimiento(processor)
 
         elif choice == "0":
             processor.close()
@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+
+from src import MODEL
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    processor = MODEL.TableProcessor(str(tmp_path / 'bulk.db'))
+    processor.SetTable('OLD', pd.DataFrame({'x': [1, 2, 3]}))
+    yield processor
+    processor.close()
+
+def test_drop_table_outside_bulk_load(processor):
+    assert processor.DropTable('OLD', confirm=False)
+    assert not processor.table_exists('OLD')
+
+def test_drop_table_joins_the_bulk_load(processor):
+    with pytest.raises(RuntimeError):
+        with processor.BulkLoad():
+            processor.SetTable('T', pd.DataFrame({'x': [1, 2]}))
+            processor.DropTable('OLD', confirm=False)
+            raise RuntimeError("fallo dentro de la carga")
+
+    assert not processor.table_exists('T')
+    assert processor.GetTables('OLD')['x'].tolist() == [1, 2, 3]
+
+def _indices(processor, tabla):
+    return {fila[0] for fila in processor.conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?", (tabla,))}
+
+def test_raise_rolls_back_every_write(processor):
+    with pytest.raises(RuntimeError):
+        with processor.BulkLoad():
+            processor.SetTable('T', pd.DataFrame({'x': [1, 2]}))
+            processor.SetTable('OLD', pd.DataFrame({'x': [9]}))
+            processor.ConcatTables(['OLD', 'T'], 'U')
+            raise RuntimeError("fallo dentro de la carga")
+
+    assert not processor.table_exists('T')
+    assert not processor.table_exists('U')
+    assert processor.GetTables('OLD')['x'].tolist() == [1, 2, 3]
+
+def test_nested_bulk_load_joins_the_outer_one(processor):
+    with pytest.raises(RuntimeError):
+        with processor.BulkLoad() as exterior:
+            with processor.BulkLoad() as interior:
+                processor.SetTable('T', pd.DataFrame({'x': [1, 2]}))
+            assert interior is exterior
+            # The inner block ended without committing
+            assert processor.conn.in_transaction
+            raise RuntimeError("fallo dentro de la carga")
+
+    assert not processor.table_exists('T')
+
+def test_indexes_are_recreated_on_exit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    processor = MODEL.TableProcessor(str(tmp_path / 'indices.db'), index_spec={'T': ['x'], 'N': ['x']})
+    processor.SetTable('T', pd.DataFrame({'x': [1, 2]}))
+    assert _indices(processor, 'T') == {'ix_T_x'}
+
+    with processor.BulkLoad() as stats:
+        processor.SetTable('T', pd.DataFrame({'x': [3, 4, 5]}))
+        processor.SetTable('N', pd.DataFrame({'x': [6]}))
+        assert _indices(processor, 'T') == set()
+        assert _indices(processor, 'N') == set()
+
+    assert _indices(processor, 'T') == {'ix_T_x'}
+    assert _indices(processor, 'N') == {'ix_N_x'}
+    assert stats['rows'] == 4
+    processor.close()
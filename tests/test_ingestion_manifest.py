@@ -0,0 +1,44 @@
+import os
+
+import pandas as pd
+import pytest
+
+from src import MODEL
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    processor = MODEL.TableProcessor(str(tmp_path / 'manifest.db'))
+    yield processor
+    processor.close()
+
+@pytest.fixture
+def libro(tmp_path):
+    ruta = str(tmp_path / 'VENTA_1.xlsx')
+    pd.DataFrame({'Cliente': ['C1', 'C2'], 'Valor Neto': [10.0, 20.0]}).to_excel(ruta, index=False)
+    return ruta
+
+def _tocar(ruta):
+    # Same content, newer mtime: the manifest has to hash the file and refresh the mtime
+    stat = os.stat(ruta)
+    os.utime(ruta, (stat.st_atime, stat.st_mtime + 10))
+
+def test_touched_file_is_skipped(processor, libro):
+    processor.ImportFromExcel(libro, table_name='VENTA_1')
+    _tocar(libro)
+
+    resultados = processor.ImportManyFromExcel([(libro, None, 'VENTA_1')], max_workers=1, skip_unchanged=True)
+
+    assert [resultado['status'] for resultado in resultados] == ['skipped']
+
+def test_touched_file_keeps_bulk_load_atomic(processor, libro):
+    processor.ImportFromExcel(libro, table_name='VENTA_1')
+    _tocar(libro)
+
+    with pytest.raises(RuntimeError):
+        with processor.BulkLoad():
+            processor.SetTable('T', pd.DataFrame({'x': [1, 2]}))
+            processor.ImportManyFromExcel([(libro, None, 'VENTA_1')], max_workers=1, skip_unchanged=True)
+            raise RuntimeError("fallo dentro de la carga")
+
+    assert not processor.table_exists('T')
@@ -0,0 +1,72 @@
+import random
+
+import pandas as pd
+import pytest
+
+from src import CONTROLLER, MODEL
+
+# Dimensions with the cases the steps branch on: unmatched keys, keys with blanks,
+# missing volumes, service and packaging codes, Walmart clients
+DIMENSIONES = {
+    'CANAL': {'CANAL_ID': ['10', '20', '30'], 'CANAL_DESCRIP': ['RETAIL', 'WHOLESALE', 'B2B']},
+    'CENTROS': {'CENTRO': ['G601', 'P100', 'H200'], 'PAIS_2': ['GUATEMALA', 'PAN - MODELO', 'TEGUCIPALPA'],
+                'CENTRO_ID': ['G601', 'P100', 'H200'], 'FILTRO_CENTRO': ['SI', 'SI', 'NO']},
+    'SEGMENTO_CLIENTE': {'PAIS_CANAL_ID_CLIENTE': ['GUATEMALA10C1'], 'SEGMENTO_CLIENTE': ['SEG-A']},
+    'SEGMENTO_CODIGO': {'MATERIAL': ['1000-01', 'E000000000-01'], 'SEGMENTO': ['SEG-P', 'SEG-E']},
+    'TIPO_FACTURAS': {'TIPO_FACTURA': ['ZFAC', 'ZSER'], 'VENTA_BRUTA': ['SI', 'NO']},
+    'MARA': {'Material': ['1000-01', 'E000000000-01', '500-01', 'SER000306-03'],
+             'Texto_breve_de_material': ['PINT', 'EMP', 'X', 'SERV'], 'Volumen': [1.0, None, 2.5, 0.0]},
+    'CODIGOS_CAMBIAN': {'CODIGO_SER': [' 9999-01 '], 'CODIGO_PT': ['1000-01']},
+    'CLIENTES': {'Deudor': ['C1', 'C2', '110004493'], 'Nombre_1': ['UNO', 'GRUPO DEWARE S.A', 'WALMART']},
+    'WALMART_ESA_MASTER_PACK': {'CODIGO_SAP': ['1000-01'], 'MASTERPACK_COMERCIAL': [6.0]},
+}
+
+def _venta(filas=2000, semilla=0):
+    rng = random.Random(semilla)
+    elegir = lambda valores: [rng.choice(valores) for _ in range(filas)]
+    return pd.DataFrame({
+        'Centro': elegir(['G601', 'P100', 'H200', 'ZZZ']),
+        'Canal distribución': elegir(['10', '20', '30']),
+        'Cliente': elegir(['C1', 'C2', '110004493', 'C9']),
+        'Artículo': elegir(['1000-01', 'E000000000-01', '500-01', '9999-01', 'S100', 'D1']),
+        'Clase de factura': elegir(['ZFAC', 'ZSER']),
+        'Período/Año': elegir(['001.2024', '002.2024']),
+        'Volumen de ventas': [float(rng.randint(1, 100)) for _ in range(filas)],
+        'Valor Neto': [float(rng.randint(1, 1000)) for _ in range(filas)],
+    })
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    # AddColumns appends its warnings to merge_warnings.txt in the working directory
+    monkeypatch.chdir(tmp_path)
+    processor = MODEL.TableProcessor(str(tmp_path / 'fixture.db'))
+    for tabla, columnas in DIMENSIONES.items():
+        processor.SetTable(tabla, MODEL._apply_schema(pd.DataFrame(columnas), CONTROLLER.ESQUEMAS[tabla]))
+    processor.SetTable('VentaHistoricaTOTAL', _venta())
+    yield processor
+    processor.close()
+
+def test_add_columns_in_sql_matches_pandas(processor):
+    esperado = CONTROLLER._ejecutarPasos(processor.GetTables('VentaHistoricaTOTAL'), processor, mostrar=False)
+
+    filas = processor.AddColumnsInSQL('VentaHistoricaTOTAL', CONTROLLER._definicionesVentaHistorica(),
+                                      output_table='VentaHistoricaTOTAL_SQL',
+                                      drop_columns=CONTROLLER.COLUMNAS_TEMPORALES)
+    obtenido = processor.GetTables('VentaHistoricaTOTAL_SQL')
+
+    assert filas == len(esperado)
+    pd.testing.assert_frame_equal(obtenido, esperado)
+
+def test_add_columns_in_sql_without_materialized_hint(processor, monkeypatch):
+    # SQLite before 3.35 rejects `AS MATERIALIZED`, the compiled query must not use it there
+    monkeypatch.setattr(MODEL.sqlite3, 'sqlite_version_info', (3, 34, 1))
+    consulta = MODEL._compile_add_columns('VentaHistoricaTOTAL', processor.GetColumns('VentaHistoricaTOTAL'),
+                                          CONTROLLER._definicionesVentaHistorica(),
+                                          {tabla: list(columnas) for tabla, columnas in DIMENSIONES.items()},
+                                          CONTROLLER.COLUMNAS_TEMPORALES)
+    assert 'MATERIALIZED' not in consulta
+
+    esperado = CONTROLLER._ejecutarPasos(processor.GetTables('VentaHistoricaTOTAL'), processor, mostrar=False)
+    processor.AddColumnsInSQL('VentaHistoricaTOTAL', CONTROLLER._definicionesVentaHistorica(),
+                              output_table='VentaHistoricaTOTAL_SQL', drop_columns=CONTROLLER.COLUMNAS_TEMPORALES)
+    pd.testing.assert_frame_equal(processor.GetTables('VentaHistoricaTOTAL_SQL'), esperado)